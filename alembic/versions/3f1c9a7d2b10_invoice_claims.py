@@ -0,0 +1,30 @@
+"""invoice claims
+
+Revision ID: 3f1c9a7d2b10
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('invoices', sa.Column('claim_token', sa.CHAR(length=36), nullable=True))
+    op.add_column('invoices', sa.Column('claim_expires_at', sa.TIMESTAMP(), nullable=True))
+    op.create_index(op.f('ix_invoices_claim_token'), 'invoices', ['claim_token'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_invoices_claim_token'), table_name='invoices')
+    op.drop_column('invoices', 'claim_expires_at')
+    op.drop_column('invoices', 'claim_token')
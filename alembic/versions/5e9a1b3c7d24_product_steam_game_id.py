@@ -0,0 +1,39 @@
+"""product steam_game_id
+
+Revision ID: 5e9a1b3c7d24
+Revises: c4d7e2a9f053
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a1b3c7d24'
+down_revision: Union[str, None] = 'c4d7e2a9f053'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('steam_game_id', sa.Integer(), nullable=True))
+    # Уже импортированные подарки: id игры есть в image_url; при дублях ключ получает самый старый товар
+    op.execute(
+        "UPDATE products p JOIN ("
+        "  SELECT MIN(id) AS id,"
+        "         CAST(SUBSTRING_INDEX(SUBSTRING_INDEX(image_url, '/apps/', -1), '/', 1) AS UNSIGNED) AS app_id"
+        "  FROM products"
+        "  WHERE subcategory_id = 7 AND image_url LIKE 'https://cdn.cloudflare.steamstatic.com/steam/apps/%'"
+        "  GROUP BY app_id"
+        ") g ON g.id = p.id "
+        "SET p.steam_game_id = g.app_id"
+    )
+    op.create_unique_constraint('uq_products_steam_game_id', 'products', ['steam_game_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_products_steam_game_id', 'products', type_='unique')
+    op.drop_column('products', 'steam_game_id')
@@ -0,0 +1,30 @@
+"""invoice history indexes
+
+Revision ID: 9d3b6f2e8a41
+Revises: 5e9a1b3c7d24
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3b6f2e8a41'
+down_revision: Union[str, None] = '5e9a1b3c7d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # История заказов: WHERE user_id = ? [AND status IN (...)] AND id < ? ORDER BY id DESC.
+    # status в конце индекса, чтобы отбор страницы по статусу не читал строки таблицы
+    op.create_index('ix_invoices_user_history', 'invoices', ['user_id', 'id', 'status'], unique=False)
+    # Очередь выдачи: WHERE status = 'paid' ORDER BY id
+    op.create_index('ix_invoices_status_id', 'invoices', ['status', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_invoices_status_id', table_name='invoices')
+    op.drop_index('ix_invoices_user_history', table_name='invoices')
@@ -0,0 +1,51 @@
+"""token blacklist hashes
+
+Revision ID: c4d7e2a9f053
+Revises: 8b2e4d6f1a37
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d7e2a9f053'
+down_revision: Union[str, None] = '8b2e4d6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'token_blacklist_new',
+        sa.Column('token_hash', sa.CHAR(length=64), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('token_hash'),
+    )
+    # exp из JWT в SQL не достать; одноразовые токены живут не дольше часа
+    op.execute(
+        "INSERT INTO token_blacklist_new (token_hash, user_id, expires_at) "
+        "SELECT SHA2(token, 256), user_id, UTC_TIMESTAMP() + INTERVAL 1 HOUR FROM token_blacklist"
+    )
+    op.drop_table('token_blacklist')
+    op.rename_table('token_blacklist_new', 'token_blacklist')
+    op.create_index(op.f('ix_token_blacklist_expires_at'), 'token_blacklist', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Исходные токены из хэшей не восстановить, старая таблица создается пустой
+    op.drop_index(op.f('ix_token_blacklist_expires_at'), table_name='token_blacklist')
+    op.drop_table('token_blacklist')
+    op.create_table(
+        'token_blacklist',
+        sa.Column('token', sa.String(length=500), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('token'),
+    )
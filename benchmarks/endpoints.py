@@ -0,0 +1,332 @@
+"""
+Нагрузочный бенчмарк горячих эндпоинтов.
+
+Поднимает app из main.py в том же процессе (httpx.ASGITransport, без uvicorn и сети)
+поверх SQLite или отдельной MySQL-базы с синтетическим каталогом и историей счетов.
+Внешние сервисы (email, LAVA, steam, курсы валют, telegram) заменены локальными
+заглушками. Для каждого сценария печатает p50/p95/p99 и пропускную способность.
+
+    python -m benchmarks.endpoints --save-baseline benchmarks/baseline.json
+    python -m benchmarks.endpoints --compare benchmarks/baseline.json
+
+По умолчанию база - временный файл SQLite; --database-url задает другую (MySQL - только
+пустая тестовая база, скрипт создает таблицы и пишет в нее). Настройки приложения
+(CATALOG_CACHE_TTL, DB_POOL_SIZE, BCRYPT_ROUNDS, ...) берутся из окружения как обычно.
+Базовые результаты зависят от машины: сравнивайте только прогоны на одном окружении.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+INVOICE_STATUSES = ["wait", "paid", "process", "order_ok", "order_error", "canceled"]
+# Переменные, без которых приложение не стартует; реальные значения из окружения не перетираются
+APP_ENV_DEFAULTS = {
+    "JWT_SECRET": "benchmark-secret",
+    "SECRET_DIGI": "benchmark-digi",
+    "TELEGRAM_BOT_TOKEN": "0:benchmark",
+    "API_LAVA_CREATE": "https://lava.stub/invoice/create",
+    "API_LAVA_TOKEN": "benchmark",
+    "LAVA_SHOP_ID": "benchmark",
+    "LAVA_SUCCESS_URL": "https://gamemoneta.stub/success",
+    "EMAIL_API": "https://email.stub/send",
+    "STEAM_LOGIN_URL": "https://steam.stub/",
+    "CURRENCY_RATE_URL": "https://currency.stub/get_currency_rate",
+    # Все запросы бенчмарка идут с одного адреса, лимитер оставил бы от них только 429
+    "RATE_LIMIT_ENABLED": "0",
+}
+
+
+def stub_response(upstream: str, request: httpx.Request) -> httpx.Response:
+    if upstream == "currency":
+        value = 9000.0 if request.url.params.get("code") == "RUB" else 90.0
+        return httpx.Response(200, json={"data": {"value": value, "update_time": 1700000000}})
+    if upstream == "lava":
+        order_id = json.loads(request.content)["orderId"]
+        return httpx.Response(200, json={
+            "data": {"id": str(uuid.uuid4()), "amount": 100.0, "expired": "2030-01-01 00:00:00", "status": 1,
+                     "shop_id": "benchmark", "url": f"https://lava.stub/pay/{order_id}",
+                     "merchantName": "benchmark"},
+            "status": 200,
+            "status_check": True,
+        })
+    if upstream == "steam":
+        return httpx.Response(200, json={"response": {"success": 1}})
+    if upstream == "payment":
+        return httpx.Response(200, json={"uuid": str(uuid.uuid4())})
+    return httpx.Response(200, json={"ok": True, "success": True})
+
+
+def install_stubs() -> None:
+    from http_clients import UPSTREAMS, override_transport
+
+    for name in UPSTREAMS:
+        override_transport(name, httpx.MockTransport(lambda request, name=name: stub_response(name, request)))
+
+
+def configure_sqlite(engine, path: str) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+        dbapi_connection.execute(f"ATTACH DATABASE '{path}.majorofficial' AS majorofficial")
+
+
+async def seed(products: int, invoices: int, rnd: random.Random) -> dict:
+    from sqlalchemy import insert
+    from sqlalchemy.future import select
+
+    from database import AsyncSessionLocal, Base, engine
+    from models import Category, Subcategory, User
+    from models.invoice import Invoice
+    from models.product import Product, ProductOption
+    from passwords import password_hasher
+
+    async with engine.begin() as connection:
+        tables = [table for table in Base.metadata.sorted_tables
+                  if table.schema is None or engine.dialect.name == "sqlite"]
+        await connection.run_sync(Base.metadata.create_all, tables=tables)
+        if engine.dialect.name == "sqlite":
+            # В SQLite автоинкремент бывает только у первичного ключа, а invoices.id - не он
+            await connection.exec_driver_sql(
+                "CREATE TRIGGER IF NOT EXISTS invoices_autoincrement_id AFTER INSERT ON invoices "
+                "WHEN NEW.id IS NULL BEGIN UPDATE invoices SET id = NEW.rowid WHERE rowid = NEW.rowid; END"
+            )
+
+    async with AsyncSessionLocal() as db:
+        category = Category(name="Benchmark", type="game")
+        db.add(category)
+        await db.flush()
+        subcategory = Subcategory(name="Benchmark", category_id=category.id)
+        db.add(subcategory)
+        await db.flush()
+
+        await db.execute(insert(Product), [
+            {"subcategory_id": subcategory.id, "name": f"Product {i}", "description": "Synthetic product " * 10,
+             "price": rnd.randint(100, 10000), "image_url": f"https://cdn.stub/{i}.jpg"}
+            for i in range(products)
+        ])
+        product_ids = list((await db.execute(
+            select(Product.id).where(Product.subcategory_id == subcategory.id)
+        )).scalars())
+        await db.execute(insert(ProductOption), [
+            {"product_id": product_id, "option_name": "region", "type": "select", "title": "Region",
+             "items": [{"label": label, "price": rnd.randint(0, 500)} for label in ("RU", "KZ", "EU")]}
+            for product_id in product_ids
+        ])
+
+        user = User(email=BENCH_EMAIL, name="Benchmark", bonuses=0,
+                    hashed_password=await password_hasher.hash(BENCH_PASSWORD))
+        db.add(user)
+        await db.flush()
+
+        invoice_uuids = [str(uuid.uuid4()) for _ in range(invoices)]
+        for offset in range(0, invoices, 1000):
+            await db.execute(insert(Invoice), [
+                {"uuid": invoice_uuid, "product_id": rnd.choice(product_ids), "user_id": user.id,
+                 "payment_method": "card", "delivery_email": BENCH_EMAIL, "order_info": {},
+                 "status": rnd.choice(INVOICE_STATUSES)}
+                for invoice_uuid in invoice_uuids[offset:offset + 1000]
+            ])
+        await db.commit()
+
+    return {"product_ids": product_ids, "invoice_uuids": invoice_uuids, "user_id": user.id}
+
+
+@dataclass
+class Scenario:
+    name: str
+    send: Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+
+def build_scenarios(data: dict) -> List[Scenario]:
+    from utils import SECRET_DIGI, create_access_token
+
+    auth = {"Authorization": f"Bearer {create_access_token({'sub': str(data['user_id'])})}"}
+    product_ids, invoice_uuids = data["product_ids"], data["invoice_uuids"]
+
+    def sign(invoice_uuid: str, invoice_status: str) -> str:
+        return hmac.new(SECRET_DIGI.encode(), f"{invoice_uuid}:{invoice_status}".encode(), hashlib.sha256).hexdigest()
+
+    async def get_all_products(client, rnd):
+        return await client.get("/api/products/", params={"limit": 50, "cursor": rnd.choice(product_ids)})
+
+    async def get_product_by_id(client, rnd):
+        return await client.get(f"/api/products/{rnd.choice(product_ids)}")
+
+    async def create_invoice(client, rnd):
+        return await client.post("/api/invoice/", headers=auth, json={
+            "payment_method": "card", "product_id": rnd.choice(product_ids), "amount": "100.00",
+            "payment_system": "lava", "order_info": {}, "delivery_email": BENCH_EMAIL,
+        })
+
+    async def get_invoice(client, rnd):
+        return await client.get(f"/api/invoice/get/{rnd.choice(invoice_uuids)}", headers=auth)
+
+    async def change_invoice_status(client, rnd):
+        invoice_uuid, invoice_status = rnd.choice(invoice_uuids), rnd.choice(INVOICE_STATUSES)
+        return await client.post("/api/invoice/change_status", json={"uuid": invoice_uuid, "status": invoice_status},
+                                 headers={"X-Signature": sign(invoice_uuid, invoice_status)})
+
+    async def login(client, rnd):
+        return await client.post("/api/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+
+    return [Scenario(send.__name__, send) for send in (
+        get_all_products, get_product_by_id, create_invoice, get_invoice, change_invoice_status, login,
+    )]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int,
+                       warmup: int, rnd: random.Random) -> dict:
+    for _ in range(warmup):
+        await scenario.send(client, rnd)
+
+    timings: List[float] = []
+    errors = 0
+    todo = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in todo:
+            started = time.perf_counter()
+            try:
+                response = await scenario.send(client, rnd)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            timings.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "rps": round(requests / elapsed, 1),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> List[str]:
+    """Регрессии: p95 выросла или пропускная способность упала больше чем на tolerance."""
+    regressions = []
+    print(f"\n{'scenario':<24}{'p95 base':>10}{'p95 now':>10}{'delta':>9}{'rps base':>10}{'rps now':>10}{'delta':>9}")
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<24}  (no baseline)")
+            continue
+        p95_delta = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_delta = result["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        print(f"{name:<24}{base['p95_ms']:>10.2f}{result['p95_ms']:>10.2f}{p95_delta:>+9.1%}"
+              f"{base['rps']:>10.1f}{result['rps']:>10.1f}{rps_delta:>+9.1%}")
+        if p95_delta > tolerance or rps_delta < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+async def main(args) -> int:
+    from database import engine
+
+    if engine.dialect.name == "sqlite":
+        configure_sqlite(engine, engine.url.database)
+
+    rnd = random.Random(args.seed)
+    data = await seed(args.products, args.invoices, rnd)
+
+    # Импорт main запускает фоновые задачи, которым уже нужны таблицы
+    import main as app_module
+    install_stubs()
+    await app_module.app.router.startup()
+
+    selected = set(args.only or ())
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            print(f"{'scenario':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'errors':>8}")
+            for scenario in build_scenarios(data):
+                if selected and scenario.name not in selected:
+                    continue
+                result = await run_scenario(client, scenario, args.requests, args.concurrency, args.warmup, rnd)
+                results[scenario.name] = result
+                print(f"{scenario.name:<24}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                      f"{result['p99_ms']:>10.2f}{result['rps']:>10.1f}{result['errors']:>8}")
+    finally:
+        await app_module.app.router.shutdown()
+
+    meta = {
+        "database": engine.dialect.name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "products": args.products,
+        "invoices": args.invoices,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+    }
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump({"meta": meta, "results": results}, file, indent=2, ensure_ascii=False)
+        print(f"\nbaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        differs = {key: (baseline["meta"].get(key), value) for key, value in meta.items()
+                   if key not in ("created_at",) and baseline["meta"].get(key) != value}
+        if differs:
+            print(f"\nwarning: run parameters differ from the baseline: {differs}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nregressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Default: a fresh SQLite file in a temporary directory")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--invoices", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for data and request mix")
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO", help="Run only these scenarios")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Exit with 1 if a scenario regressed vs this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95/rps change, 0.2 = 20%%")
+    arguments = parser.parse_args()
+
+    # Окружение должно быть готово до импорта модулей приложения
+    workdir = tempfile.mkdtemp(prefix="gamemoneta-bench-")
+    os.environ["DATABASE_URL"] = arguments.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ.setdefault("LOG_FILE_PATH", os.path.join(workdir, "errors.log"))
+    for key, value in APP_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+    sys.exit(asyncio.run(main(arguments)))
@@ -0,0 +1,416 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from uuid import uuid4
+
+from fastapi import Request, Response, status
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 300))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", 512))
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", 60))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.getenv("CATALOG_STALE_WHILE_REVALIDATE", 300))
+# Общее хранилище для кэшей, которые должны совпадать у всех процессов, например redis://localhost:6379/0
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL")
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+logger = logging.getLogger('Gamemoneta.site.cache')
+
+_MISSING = object()
+
+
+class _LoadCancelled(Exception):
+    """Запрос, выполнявший загрузку в ResultCache.get_or_load, отменен; ожидающие загружают сами."""
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    Не потокобезопасен: рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+class BloomFilter:
+    """
+    Вероятностное множество строковых ключей: might_contain() может ошибиться только
+    в сторону True, поэтому отрицательный ответ позволяет пропустить запрос в базу.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class CacheBackend:
+    """
+    Общее хранилище для ResultCache. Значения - JSON-строки, ошибки хранилища
+    не должны ломать запрос, поэтому ResultCache их логирует и работает как без него.
+    """
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str, prefix: str = "gamemoneta:"):
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self.client.set(self.prefix + key, value, px=max(int(ttl * 1000), 1))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+_shared_backend: Optional[CacheBackend] = None
+
+
+def shared_backend() -> Optional[CacheBackend]:
+    """Хранилище из SHARED_CACHE_URL или None, если оно не настроено (кэши остаются локальными)."""
+    global _shared_backend
+    if _shared_backend is None and SHARED_CACHE_URL:
+        if not REDIS_AVAILABLE:
+            logger.error("SHARED_CACHE_URL is set but the redis package is not installed, using local caches")
+            return None
+        _shared_backend = RedisBackend(SHARED_CACHE_URL)
+    return _shared_backend
+
+
+async def close_shared_backend() -> None:
+    global _shared_backend
+    if _shared_backend is not None:
+        await _shared_backend.close()
+        _shared_backend = None
+
+
+class ResultCache:
+    """
+    Кэш результатов внешних проверок с разным временем жизни для положительных и отрицательных
+    ответов и дедупликацией одновременных загрузок одного ключа (single-flight).
+
+    Локальный LRU работает всегда; если передан backend, результаты дополнительно пишутся в него,
+    и другие процессы получают их без повторного запроса к апстриму.
+    """
+
+    def __init__(self, name: str, maxsize: int, positive_ttl: float, negative_ttl: float,
+                 backend: Optional[CacheBackend] = None, is_positive: Callable[[Any], bool] = bool):
+        self.name = name
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.backend = backend
+        self.is_positive = is_positive
+        self._local = TTLCache(maxsize=maxsize, ttl=positive_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._writes: set[asyncio.Task] = set()
+
+    def ttl_for(self, value: Any) -> float:
+        return self.positive_ttl if self.is_positive(value) else self.negative_ttl
+
+    async def get(self, key: str) -> Any:
+        value = self._local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.backend is None:
+            return None
+
+        try:
+            raw = await self.backend.get(f"{self.name}:{key}")
+        except Exception as e:
+            logger.error(f"Shared cache read failed for {self.name}:{key}: {e}")
+            return None
+        if raw is None:
+            return None
+
+        value = json.loads(raw)
+        # Точный остаток TTL из хранилища не известен - берем не больше собственного TTL значения
+        self._local.set(key, value, ttl=self.ttl_for(value))
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Сразу пишет в локальный кэш; запись в общее хранилище идет в фоне."""
+        ttl = self.ttl_for(value)
+        self._local.set(key, value, ttl=ttl)
+        if self.backend is not None:
+            task = asyncio.get_running_loop().create_task(self._write_backend(key, json.dumps(value), ttl))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write_backend(self, key: str, raw: str, ttl: float) -> None:
+        try:
+            await self.backend.set(f"{self.name}:{key}", raw, ttl)
+        except Exception as e:
+            logger.error(f"Shared cache write failed for {self.name}:{key}: {e}")
+
+    async def delete(self, key: str) -> None:
+        self._local.delete(key)
+        if self.backend is not None:
+            try:
+                await self.backend.delete(f"{self.name}:{key}")
+            except Exception as e:
+                logger.error(f"Shared cache delete failed for {self.name}:{key}: {e}")
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает закэшированное значение или вызывает load() один раз на все одновременные
+        запросы с этим ключом. Исключение из load() не кэшируется и получают все ожидающие.
+        Если загружавший запрос отменен (клиент отключился), загрузку заново начинает один из ожидающих.
+        """
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except _LoadCancelled:
+                inflight = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self.get(key)
+            if value is None:
+                value = await load()
+                if value is not None:
+                    self.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            # Отмена касается только этого запроса, ожидающие не должны ее получить
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже получено вызывающим; не даем future ругаться "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    @property
+    def stats(self) -> dict:
+        return {"size": len(self._local), "hits": self._local.hits, "misses": self._local.misses,
+                "inflight": len(self._inflight)}
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def catalog_cache_control() -> str:
+    return f"public, max-age={CATALOG_MAX_AGE}, stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}"
+
+
+class CatalogCache:
+    """
+    Кэш готовых (сериализованных) ответов каталога вместе с их ETag.
+
+    Горячие чтения отдают байты из кэша без SQL и без Pydantic,
+    а условные запросы с совпавшим If-None-Match получают 304.
+    Любая запись в каталог должна вызывать invalidate().
+
+    Кэш у каждого воркера свой; invalidate_catalog() очищает его во всех воркерах через
+    SHARED_CACHE_URL. Без общего хранилища остальные воркеры отдают старые ответы до CATALOG_CACHE_TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.version = 0
+
+    def get(self, key: str) -> Optional[tuple[bytes, str]]:
+        return self._entries.get(key)
+
+    def set(self, key: str, body: bytes) -> tuple[bytes, str]:
+        entry = (body, make_etag(body))
+        self._entries.set(key, entry)
+        return entry
+
+    def invalidate(self) -> None:
+        self.version += 1
+        self._entries.clear()
+
+    async def response(self, request: Request, key: str, build: Callable[[], Awaitable[bytes]]) -> Response:
+        entry = self.get(key)
+        if entry is None:
+            version = self.version
+            body = await build()
+            # Если каталог поменялся, пока строился ответ, - не кэшируем устаревшие данные
+            entry = self.set(key, body) if version == self.version else (body, make_etag(body))
+
+        body, etag = entry
+        headers = {"ETag": etag, "Cache-Control": catalog_cache_control()}
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+catalog_cache = CatalogCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+
+
+class CatalogInvalidations:
+    """
+    Рассылка invalidate_catalog() по воркерам через pub/sub общего хранилища (SHARED_CACHE_URL).
+
+    Воркер, выполнивший запись, очищает свой кэш сразу и публикует событие; остальные очищают
+    кэш, получив его. Пока подписка переподключается, события теряются, поэтому после каждой
+    (пере)подписки кэш очищается целиком.
+    """
+
+    def __init__(self, cache: CatalogCache, channel: str = "gamemoneta:catalog-invalidate"):
+        self.cache = cache
+        self.channel = channel
+        self.origin = uuid4().hex
+        self.client = None
+        self._task: Optional[asyncio.Task] = None
+        self._writes: set[asyncio.Task] = set()
+        self.received = 0
+
+    async def start(self, client=None) -> None:
+        if client is None:
+            backend = shared_backend()
+            client = backend.client if isinstance(backend, RedisBackend) else None
+        if client is None:
+            return
+        self.client = client
+        self._task = asyncio.create_task(self._listen(), name="catalog-invalidations")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self.cache.invalidate()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message" and message["data"] != self.origin:
+                            self.received += 1
+                            self.cache.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog invalidation subscription failed: {e}")
+                await asyncio.sleep(1)
+
+    def publish(self) -> None:
+        if self.client is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._publish())
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _publish(self) -> None:
+        try:
+            await self.client.publish(self.channel, self.origin)
+        except Exception as e:
+            logger.error(f"Failed to publish catalog invalidation: {e}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._writes, return_exceptions=True)
+        self.client = None
+
+    @property
+    def stats(self) -> dict:
+        return {"shared": self.client is not None, "received": self.received}
+
+
+catalog_invalidations = CatalogInvalidations(catalog_cache)
+
+
+def invalidate_catalog() -> None:
+    """Вызывать после commit записи в каталог: очищает кэш этого воркера и рассылает очистку остальным."""
+    catalog_invalidations.cache.invalidate()
+    catalog_invalidations.publish()
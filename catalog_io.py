@@ -0,0 +1,290 @@
+import csv
+import io
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from models.product import Product, ProductOption, Alias, Faq, ProductDelivery
+from schemas.product import CatalogProductRow, ImportChunk
+
+CATALOG_IMPORT_CHUNK = int(os.getenv("CATALOG_IMPORT_CHUNK", 500))
+CATALOG_EXPORT_CHUNK = int(os.getenv("CATALOG_EXPORT_CHUNK", 1000))
+
+PRODUCT_COLUMNS = ("subcategory_id", "steam_game_id", "name", "description", "price", "image_url", "preview_image_url")
+CSV_COLUMNS = ("id", *PRODUCT_COLUMNS, "options", "aliases", "faq", "delivery_inputs")
+LIST_COLUMNS = ("options", "aliases", "faq", "delivery_inputs")
+
+# Дочерние таблицы товара: поле строки -> (модель, колонки)
+CHILDREN = {
+    "options": (ProductOption, ("type", "option_name", "title", "cols", "items", "item", "default_value", "label",
+                                "tooltip", "description", "child_group_name", "is_required", "icon",
+                                "can_be_disabled")),
+    "aliases": (Alias, ("alias",)),
+    "faq": (Faq, ("question", "answer")),
+    "delivery_inputs": (ProductDelivery, ("type", "key", "is_required", "label", "placeholder", "value", "tooltip",
+                                          "description")),
+}
+
+
+class CatalogImportError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+def upsert_statement(dialect: str, model, rows: List[dict], conflict_column, update_fields: Sequence[str]):
+    """
+    Многострочный INSERT с обновлением существующих строк. В MySQL конфликтом считается
+    совпадение любого уникального ключа, в SQLite - только conflict_column.
+    """
+    if dialect == "mysql":
+        statement = mysql.insert(model).values(rows)
+        return statement.on_duplicate_key_update({field: statement.inserted[field] for field in update_fields})
+
+    if dialect == "sqlite":
+        statement = sqlite.insert(model).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=[conflict_column],
+            set_={field: statement.excluded[field] for field in update_fields},
+        )
+
+    raise NotImplementedError(f"Upsert is not implemented for {dialect}")
+
+
+async def replace_children(db: AsyncSession, rows: Sequence[Tuple[int, CatalogProductRow]], existing: Sequence[int]):
+    """Заменяет опции, алиасы, FAQ и поля доставки товаров: один DELETE и один INSERT на таблицу."""
+    for field, (model, columns) in CHILDREN.items():
+        if existing:
+            await db.execute(delete(model).where(model.product_id.in_(existing)))
+
+        values = []
+        for product_id, row in rows:
+            for child in getattr(row, field):
+                if isinstance(child, str):
+                    values.append({"product_id": product_id, columns[0]: child})
+                else:
+                    values.append({"product_id": product_id, **{column: getattr(child, column) for column in columns}})
+        if values:
+            await db.execute(insert(model), values)
+
+
+async def import_catalog_chunk(db: AsyncSession, rows: Sequence[CatalogProductRow]) -> ImportChunk:
+    """
+    Строки с id обновляют товар по первичному ключу, строки с steam_game_id - по нему,
+    остальные создаются. Commit делает вызывающий.
+    """
+    started = time.perf_counter()
+    dialect = db.bind.dialect.name
+    by_id = {row.id: row for row in rows if row.id is not None}
+    by_game = {row.steam_game_id: row for row in rows if row.id is None and row.steam_game_id is not None}
+    new = [row for row in rows if row.id is None and row.steam_game_id is None]
+
+    existing = []
+    if by_id:
+        existing += (await db.execute(select(Product.id).where(Product.id.in_(by_id)))).scalars().all()
+        await db.execute(upsert_statement(
+            dialect, Product, [{"id": row.id, **row.model_dump(include=set(PRODUCT_COLUMNS))} for row in by_id.values()],
+            Product.id, PRODUCT_COLUMNS,
+        ))
+
+    game_ids = {}
+    if by_game:
+        existing += (await db.execute(
+            select(Product.id).where(Product.steam_game_id.in_(by_game))
+        )).scalars().all()
+        await db.execute(upsert_statement(
+            dialect, Product, [row.model_dump(include=set(PRODUCT_COLUMNS)) for row in by_game.values()],
+            Product.steam_game_id, PRODUCT_COLUMNS,
+        ))
+        game_ids = dict((await db.execute(
+            select(Product.steam_game_id, Product.id).where(Product.steam_game_id.in_(by_game))
+        )).all())
+
+    # Без естественного ключа id можно узнать только после INSERT каждой строки
+    created = [Product(**row.model_dump(include=set(PRODUCT_COLUMNS))) for row in new]
+    if created:
+        db.add_all(created)
+        await db.flush()
+
+    product_rows = [
+        *by_id.items(),
+        *((game_ids[game_id], row) for game_id, row in by_game.items()),
+        *((product.id, row) for product, row in zip(created, new)),
+    ]
+    await replace_children(db, product_rows, existing)
+
+    return ImportChunk(
+        size=len(rows),
+        created=len(product_rows) - len(existing),
+        updated=len(existing),
+        seconds=round(time.perf_counter() - started, 6),
+    )
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, dict]]:
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            raise CatalogImportError(number, f"invalid JSON: {e}")
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, dict]]:
+    """CSV с заголовком из CSV_COLUMNS; списки (options, aliases, ...) - JSON в ячейке."""
+    header: Optional[List[str]] = None
+    record, number, start = "", 0, 0
+    async for line in lines:
+        number += 1
+        record = f"{record}\n{line}" if record else line
+        start = start or number
+        # Перевод строки внутри кавычек - запись продолжается на следующей строке
+        if record.count('"') % 2:
+            continue
+
+        values, record, line_number, start = next(csv.reader([record])), "", start, 0
+        if header is None:
+            header = values
+            continue
+        if not any(values):
+            continue
+
+        row = {}
+        for column, value in zip(header, values):
+            if column in LIST_COLUMNS:
+                try:
+                    row[column] = json.loads(value) if value else []
+                except ValueError as e:
+                    raise CatalogImportError(line_number, f"invalid JSON in {column}: {e}")
+            else:
+                row[column] = value if value != "" else None
+        yield line_number, row
+
+    if record:
+        raise CatalogImportError(start, "unterminated quoted field")
+
+
+async def import_catalog(db: AsyncSession, rows: AsyncIterator[Tuple[int, dict]],
+                         chunk_size: int = CATALOG_IMPORT_CHUNK) -> Tuple[int, List[ImportChunk], Optional[str]]:
+    """
+    Валидирует строки по CatalogProductRow и пишет их пачками с commit после каждой,
+    так что в памяти одновременно не больше chunk_size строк. На первой ошибке импорт
+    останавливается; уже записанные пачки остаются, и повторный импорт того же файла безопасен.
+
+    Returns:
+        число записанных строк, статистика пачек и текст ошибки (None при успехе).
+    """
+    imported, chunks, chunk, number = 0, [], [], 0
+    try:
+        async for number, raw in rows:
+            try:
+                chunk.append(CatalogProductRow.model_validate(raw))
+            except ValidationError as e:
+                raise CatalogImportError(number, str(e))
+
+            if len(chunk) >= chunk_size:
+                chunks.append(await import_catalog_chunk(db, chunk))
+                await db.commit()
+                imported, chunk = imported + len(chunk), []
+
+        if chunk:
+            chunks.append(await import_catalog_chunk(db, chunk))
+            await db.commit()
+            imported += len(chunk)
+    except CatalogImportError as e:
+        return imported, chunks, str(e)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        return imported, chunks, f"Chunk ending at line {number}: {e.__class__.__name__}: {e.orig if hasattr(e, 'orig') else e}"
+
+    return imported, chunks, None
+
+
+async def load_children(db: AsyncSession, product_ids: List[int]) -> Dict[str, Dict[int, list]]:
+    children = {}
+    for field, (model, columns) in CHILDREN.items():
+        grouped: Dict[int, list] = {}
+        result = await db.execute(
+            select(model.product_id, *(getattr(model, column) for column in columns))
+            .where(model.product_id.in_(product_ids))
+            .order_by(model.id)
+        )
+        for product_id, *values in result:
+            grouped.setdefault(product_id, []).append(
+                values[0] if field == "aliases" else dict(zip(columns, values))
+            )
+        children[field] = grouped
+    return children
+
+
+async def export_catalog(subcategory_id: Optional[int] = None) -> AsyncIterator[dict]:
+    """
+    Отдает товары по одному, читая их через серверный курсор пачками по CATALOG_EXPORT_CHUNK.
+    Дочерние записи пачки грузятся отдельной сессией: пока курсор открыт, соединение занято.
+    """
+    query = select(Product.id, *(getattr(Product, column) for column in PRODUCT_COLUMNS)).order_by(Product.id)
+    if subcategory_id is not None:
+        query = query.where(Product.subcategory_id == subcategory_id)
+
+    async with AsyncSessionLocal() as stream_db, AsyncSessionLocal() as db:
+        result = await stream_db.stream(query.execution_options(yield_per=CATALOG_EXPORT_CHUNK))
+        async for partition in result.partitions():
+            children = await load_children(db, [row.id for row in partition])
+            for row in partition:
+                item = dict(row._mapping)
+                if item["price"] is not None:
+                    item["price"] = float(item["price"])
+                for field in LIST_COLUMNS:
+                    item[field] = children[field].get(row.id, [])
+                yield item
+
+
+async def to_ndjson(items: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer = []
+    async for item in items:
+        buffer.append(json.dumps(item, ensure_ascii=False))
+        if len(buffer) >= 100:
+            yield ("\n".join(buffer) + "\n").encode()
+            buffer = []
+    if buffer:
+        yield ("\n".join(buffer) + "\n").encode()
+
+
+async def to_csv(items: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for item in items:
+        writer.writerow([
+            json.dumps(item[column], ensure_ascii=False) if column in LIST_COLUMNS
+            else "" if item[column] is None else item[column]
+            for column in CSV_COLUMNS
+        ])
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
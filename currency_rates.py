@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+from cache import invalidate_catalog
+from http_clients import get_http_client
+
+CURRENCY_RATE_URL = os.getenv("CURRENCY_RATE_URL", "http://195.161.62.92/steam_currency/get_currency_rate")
+CURRENCY_API_KEY = os.getenv("STEAM_LOGIN_TOKEN")
+CURRENCY_REFRESH_INTERVAL = float(os.getenv("CURRENCY_REFRESH_INTERVAL", 12 * 3600))
+CURRENCY_RETRY_INTERVAL = float(os.getenv("CURRENCY_RETRY_INTERVAL", 60))
+CURRENCY_WARMUP_TIMEOUT = float(os.getenv("CURRENCY_WARMUP_TIMEOUT", 5))
+
+logger = logging.getLogger('Gamemoneta.site.currency')
+
+
+@dataclass(frozen=True)
+class RatesSnapshot:
+    """Курсы на момент update_time: KZT - рублей за тенге, USD - рублей за доллар."""
+    KZT: float
+    USD: float
+    update_time: int
+    fetched_at: float = 0.0
+    version: int = 0
+
+    def as_dict(self) -> dict:
+        return {"KZT": self.KZT, "USD": self.USD, "update_time": self.update_time}
+
+
+# Используется, пока не получены первые курсы
+FALLBACK_RATES = RatesSnapshot(KZT=0.189490353604604, USD=98.12, update_time=1738793134)
+
+
+class CurrencyRates:
+    """
+    Курсы валют для витрины.
+
+    Текущие курсы - неизменяемый RatesSnapshot, который заменяется целиком, поэтому читатели
+    никогда не видят половину обновления. Если апстрим недоступен, отдаются последние
+    полученные курсы, а повторная попытка делается через CURRENCY_RETRY_INTERVAL.
+    """
+
+    def __init__(self, snapshot: RatesSnapshot = FALLBACK_RATES):
+        self.snapshot = snapshot
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_fallback(self) -> bool:
+        return self.snapshot.fetched_at == 0.0
+
+    async def _fetch_rate(self, client: httpx.AsyncClient, code: str) -> dict:
+        response = await client.get(CURRENCY_RATE_URL, params={"api_key": CURRENCY_API_KEY, "code": code})
+        response.raise_for_status()
+        return response.json()["data"]
+
+    async def refresh(self) -> bool:
+        client = get_http_client("currency")
+        try:
+            rub, kzt = await asyncio.gather(self._fetch_rate(client, "RUB"), self._fetch_rate(client, "KZT"))
+            snapshot = RatesSnapshot(
+                KZT=rub["value"] / 100,
+                USD=rub["value"] / kzt["value"],
+                update_time=int(kzt["update_time"]),
+                fetched_at=time.time(),
+                version=self.snapshot.version + 1,
+            )
+        except (httpx.HTTPError, ValueError, KeyError, TypeError, ZeroDivisionError) as e:
+            # В тексте ошибок httpx есть URL с api_key
+            if isinstance(e, httpx.HTTPStatusError):
+                self.last_error = f"HTTP {e.response.status_code}"
+            else:
+                self.last_error = type(e).__name__
+            logger.error(f"Currency rates refresh failed ({self.last_error}), "
+                         f"serving rates from {self.snapshot.update_time}")
+            return False
+
+        self.snapshot = snapshot
+        self.last_error = None
+        # Ответы каталога содержат курсы
+        invalidate_catalog()
+        return True
+
+    async def start(self) -> None:
+        """Первые курсы запрашиваются сразу, но старт приложения ждет их не дольше CURRENCY_WARMUP_TIMEOUT."""
+        if self._task is not None:
+            return
+        warmup = asyncio.ensure_future(self.refresh())
+        try:
+            await asyncio.wait_for(asyncio.shield(warmup), timeout=CURRENCY_WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Currency rates warm-up timed out, continuing in background")
+        self._task = asyncio.create_task(self._run(warmup), name="currency-rates")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, warmup: asyncio.Future) -> None:
+        ok = await warmup
+        while True:
+            await asyncio.sleep(CURRENCY_REFRESH_INTERVAL if ok else CURRENCY_RETRY_INTERVAL)
+            ok = await self.refresh()
+
+    @property
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            **snapshot.as_dict(),
+            "version": snapshot.version,
+            "age_seconds": round(time.time() - snapshot.fetched_at, 1) if snapshot.fetched_at else None,
+            "fallback": self.is_fallback,
+            "last_error": self.last_error,
+        }
+
+
+currency_rates = CurrencyRates()
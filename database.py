@@ -1,8 +1,12 @@
 import os
+import time
 from dotenv import load_dotenv
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+
+from metrics import DB_ACQUIRE, count_sql_query
 
 load_dotenv()
 
@@ -12,9 +16,75 @@ DB_NAME = os.getenv("MYSQL_DATABASE")
 DB_HOST = os.getenv("MYSQL_HOST")
 DB_PORT = os.getenv("MYSQL_PORT")
 
-SQLALCHEMY_DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DATABASE_URL целиком заменяет MYSQL_*, например sqlite+aiosqlite:///bench.db для бенчмарков
+SQLALCHEMY_DATABASE_URL = (os.getenv("DATABASE_URL")
+                           or f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+# "queue" - пул соединений, "null" - новое соединение на каждую сессию (для тестов)
+DB_POOL = os.getenv("DB_POOL", "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # меньше wait_timeout MySQL
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который дополнительно считает ожидания свободного соединения.
+
+    Ожиданием считается checkout, пришедший в момент, когда заняты
+    все pool_size + max_overflow соединений.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        waiting = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        if waiting:
+            self.waits += 1
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            if waiting:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_ACQUIRE.observe(elapsed)
+            if waiting:
+                self.wait_time += elapsed
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.waits, pool.wait_time, pool.timeouts = self.waits, self.wait_time, self.timeouts
+        return pool
+
+
+def _engine_options() -> dict:
+    if DB_POOL == "null":
+        return {"poolclass": NullPool}
+    if DB_POOL != "queue":
+        raise ValueError(f"Unknown DB_POOL value: {DB_POOL}")
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+    return {
+        "poolclass": MonitoredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **_engine_options())
+
+event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: count_sql_query())
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -24,6 +94,36 @@ AsyncSessionLocal = async_sessionmaker(
 
 Base = declarative_base()
 
+
+def pool_stats() -> dict:
+    """
+    Текущее состояние пула соединений.
+
+    Returns:
+        dict: checked_out - выданные соединения, idle - свободные в пуле,
+        overflow - открытые сверх pool_size, waits/wait_time/timeouts - ожидания свободного соединения.
+    """
+    pool = engine.pool
+    if not isinstance(pool, MonitoredQueuePool):
+        return {"pool": type(pool).__name__}
+
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "waits": pool.waits,
+        "wait_time": round(pool.wait_time, 6),
+        "timeouts": pool.timeouts,
+    }
+
+
+async def dispose_engine():
+    await engine.dispose()
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -0,0 +1,102 @@
+import os
+import time
+from typing import Sequence
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from catalog_io import upsert_statement
+from models.product import Product, ProductOption, Alias
+from schemas.product import GiftCreate, ImportChunk
+
+GIFT_SUBCATEGORY_ID = 7
+GIFT_IMPORT_CHUNK = int(os.getenv("GIFT_IMPORT_CHUNK", 500))
+STEAM_CDN = "https://cdn.cloudflare.steamstatic.com/steam/apps"
+
+OPTION_FIELDS = ("type", "option_name", "title", "cols", "items", "item", "default_value", "label", "tooltip",
+                 "description", "child_group_name", "is_required", "icon", "can_be_disabled")
+UPSERT_FIELDS = ("name", "description", "image_url", "preview_image_url")
+
+
+def gift_product_row(gift: GiftCreate) -> dict:
+    return {
+        "subcategory_id": GIFT_SUBCATEGORY_ID,
+        "steam_game_id": gift.steam_game_id,
+        "name": gift.name,
+        "description": gift.description,
+        "image_url": f"{STEAM_CDN}/{gift.steam_game_id}/library_600x900.jpg",
+        "preview_image_url": f"{STEAM_CDN}/{gift.steam_game_id}/capsule_616x353.jpg",
+        "price": None,
+    }
+
+
+async def import_gift_chunk(db: AsyncSession, gifts: Sequence[GiftCreate]) -> tuple[list[int], ImportChunk]:
+    """
+    Импортирует одну пачку подарков в текущей транзакции (commit делает вызывающий).
+
+    Товары пишутся одним INSERT ... ON DUPLICATE KEY UPDATE, id получаются одним SELECT
+    по steam_game_id (в MySQL нет RETURNING), опции и алиасы заменяются целиком
+    многострочными INSERT. Повторный импорт тех же подарков ничего не дублирует.
+
+    Returns:
+        id товаров в порядке gifts и статистика пачки.
+    """
+    started = time.perf_counter()
+    # При повторе steam_game_id в одной пачке побеждает последний
+    latest = {gift.steam_game_id: gift for gift in gifts}
+    game_ids = list(latest)
+
+    existing = set((await db.execute(
+        select(Product.steam_game_id).where(Product.steam_game_id.in_(game_ids))
+    )).scalars())
+
+    await db.execute(upsert_statement(
+        db.bind.dialect.name, Product, [gift_product_row(gift) for gift in latest.values()],
+        Product.steam_game_id, UPSERT_FIELDS,
+    ))
+
+    ids = dict((await db.execute(
+        select(Product.steam_game_id, Product.id).where(Product.steam_game_id.in_(game_ids))
+    )).all())
+    product_ids = list(ids.values())
+
+    if existing:
+        await db.execute(delete(ProductOption).where(ProductOption.product_id.in_(product_ids)))
+        await db.execute(delete(Alias).where(Alias.product_id.in_(product_ids)))
+
+    options = [
+        {"product_id": ids[game_id], **{field: getattr(option, field) for field in OPTION_FIELDS}}
+        for game_id, gift in latest.items() for option in gift.options or ()
+    ]
+    aliases = [
+        {"product_id": ids[game_id], "alias": alias}
+        for game_id, gift in latest.items() for alias in gift.aliases or ()
+    ]
+    if options:
+        await db.execute(insert(ProductOption), options)
+    if aliases:
+        await db.execute(insert(Alias), aliases)
+
+    chunk = ImportChunk(
+        size=len(gifts),
+        created=len(game_ids) - len(existing),
+        updated=len(existing),
+        seconds=round(time.perf_counter() - started, 6),
+    )
+    return [ids[gift.steam_game_id] for gift in gifts], chunk
+
+
+async def import_gifts(db: AsyncSession, gifts: Sequence[GiftCreate],
+                       chunk_size: int = GIFT_IMPORT_CHUNK) -> tuple[list[int], list[ImportChunk]]:
+    """
+    Импорт пачками по chunk_size с commit после каждой. Если импорт прервется,
+    уже записанные пачки останутся, и его можно безопасно повторить целиком.
+    """
+    product_ids, chunks = [], []
+    for offset in range(0, len(gifts), chunk_size):
+        ids, chunk = await import_gift_chunk(db, gifts[offset:offset + chunk_size])
+        await db.commit()
+        product_ids += ids
+        chunks.append(chunk)
+    return product_ids, chunks
@@ -0,0 +1,142 @@
+import importlib.util
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import UPSTREAM_LATENCY
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+
+
+@dataclass(frozen=True)
+class Upstream:
+    timeout: float
+    verify: bool = True
+    http2: bool = True  # по ALPN; для http:// и серверов без HTTP/2 остается HTTP/1.1
+    follow_redirects: bool = False
+
+
+# Таймаут каждого апстрима можно переопределить через HTTP_TIMEOUT_<NAME>, например HTTP_TIMEOUT_EMAIL=5
+UPSTREAMS: Dict[str, Upstream] = {
+    "email": Upstream(timeout=10.0, verify=False),
+    "currency": Upstream(timeout=10.0, verify=False, follow_redirects=True),
+    "telegram": Upstream(timeout=10.0),
+    "steam": Upstream(timeout=15.0, verify=False),
+    "payment": Upstream(timeout=15.0, verify=False),
+    "lava": Upstream(timeout=15.0),
+}
+
+
+@dataclass
+class UpstreamStats:
+    requests: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    by_status: Dict[int, int] = field(default_factory=dict)
+
+    def observe(self, seconds: float, status_code: Optional[int]) -> None:
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if status_code is None:
+            self.errors += 1
+        else:
+            self.by_status[status_code] = self.by_status.get(status_code, 0) + 1
+
+
+_stats: Dict[str, UpstreamStats] = {}
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+class _TimedTransport(httpx.AsyncBaseTransport):
+    """Транспорт-обертка, замеряющая время каждого запроса к апстриму, включая сетевые ошибки."""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status_code = None
+        try:
+            response = await self.transport.handle_async_request(request)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            _stats.setdefault(self.upstream, UpstreamStats()).observe(elapsed, status_code)
+            UPSTREAM_LATENCY.observe(elapsed, self.upstream, str(status_code or "error"))
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    upstream = UPSTREAMS[name]
+    transport = httpx.AsyncHTTPTransport(
+        verify=upstream.verify,
+        http2=upstream.http2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    timeout = float(os.getenv(f"HTTP_TIMEOUT_{name.upper()}", upstream.timeout))
+
+    return httpx.AsyncClient(
+        transport=_TimedTransport(name, transport),
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        follow_redirects=upstream.follow_redirects,
+    )
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Общий долгоживущий клиент для апстрима из UPSTREAMS.
+
+    Клиенты создаются лениво и держат пул keep-alive соединений до остановки приложения,
+    поэтому TCP/TLS рукопожатие не повторяется на каждый запрос. Закрывать клиент не нужно.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
+
+
+def override_transport(name: str, transport: httpx.AsyncBaseTransport) -> None:
+    """Подменяет сеть апстрима (заглушки в бенчмарках); статистика и метрики продолжают считаться."""
+    upstream = UPSTREAMS[name]
+    _clients[name] = httpx.AsyncClient(
+        transport=_TimedTransport(name, transport),
+        timeout=upstream.timeout,
+        follow_redirects=upstream.follow_redirects,
+    )
+
+
+async def close_http_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def upstream_stats() -> Dict[str, dict]:
+    return {
+        name: {
+            "requests": stats.requests,
+            "errors": stats.errors,
+            "avg_seconds": round(stats.total_seconds / stats.requests, 6) if stats.requests else 0.0,
+            "max_seconds": round(stats.max_seconds, 6),
+            "by_status": stats.by_status,
+        }
+        for name, stats in _stats.items()
+    }
@@ -0,0 +1,154 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+
+from cache import SHARED_CACHE_URL, REDIS_AVAILABLE
+from invoice_reads import forget_invoice
+from schemas.invoice import InvoiceStatus, InvoiceStatusEvent
+
+# Брокер для доставки событий между воркерами, например redis://localhost:6379/0.
+# Без него события видны только подписчикам того же процесса.
+INVOICE_EVENTS_URL = os.getenv("INVOICE_EVENTS_URL", SHARED_CACHE_URL)
+INVOICE_EVENTS_QUEUE_SIZE = 100
+
+logger = logging.getLogger('Gamemoneta.site.invoice_events')
+
+Deliver = Callable[[List[dict]], None]
+
+
+class InvoiceEventBroker:
+    """
+    Транспорт событий между процессами. Опубликованная пачка должна быть доставлена
+    через deliver во все процессы, включая опубликовавший.
+    """
+
+    async def start(self, deliver: Deliver) -> None:
+        raise NotImplementedError
+
+    async def publish(self, events: List[dict]) -> None:
+        raise NotImplementedError
+
+    async def stop(self) -> None:
+        pass
+
+
+class RedisBroker(InvoiceEventBroker):
+    def __init__(self, url: str, channel: str = "gamemoneta:invoice-events"):
+        import redis.asyncio as redis
+
+        self.channel = channel
+        self.client = redis.from_url(url, decode_responses=True)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._task = asyncio.create_task(self._listen(deliver), name="invoice-events")
+
+    async def _listen(self, deliver: Deliver) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # События, опубликованные во время переподключения, теряются
+                logger.error(f"Invoice events subscription failed: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, events: List[dict]) -> None:
+        await self.client.publish(self.channel, json.dumps(events))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.client.aclose()
+
+
+class InvoiceEvents:
+    """
+    Pub/sub изменений статусов счетов для /api/invoice/stream/{uuid}.
+
+    Подписка - очередь на один uuid. Без брокера publish раздает события подписчикам
+    этого процесса напрямую; с брокером - через него, чтобы их получили все воркеры.
+    """
+
+    def __init__(self):
+        self.broker: Optional[InvoiceEventBroker] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self, broker: Optional[InvoiceEventBroker] = None) -> None:
+        if broker is None and INVOICE_EVENTS_URL:
+            if REDIS_AVAILABLE:
+                broker = RedisBroker(INVOICE_EVENTS_URL)
+            else:
+                logger.error("INVOICE_EVENTS_URL is set but the redis package is not installed, "
+                             "invoice events stay in-process")
+        if broker is not None:
+            await broker.start(self._deliver)
+            self.broker = broker
+
+    async def stop(self) -> None:
+        if self.broker is not None:
+            await self.broker.stop()
+            self.broker = None
+
+    def _deliver(self, events: List[dict]) -> None:
+        for event in events:
+            # Событие приходит во все воркеры - сбрасываем и их закэшированные копии счета
+            forget_invoice(event["uuid"])
+            for queue in self._subscribers.get(event["uuid"], ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Подписчик не читает; важен только последний статус, он придет следующим
+                    pass
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, uuid: str) -> AsyncIterator[asyncio.Queue]:
+        queue = asyncio.Queue(maxsize=INVOICE_EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(uuid, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(uuid)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[uuid]
+
+    async def publish(self, *uuids: str, status: Optional[InvoiceStatus] = None,
+                      payment_status: Optional[str] = None) -> None:
+        """Вызывать после commit. Ошибка брокера не должна ломать запрос, который поменял счет."""
+        events = [
+            InvoiceStatusEvent(uuid=uuid, status=status, payment_status=payment_status).model_dump(mode="json")
+            for uuid in uuids
+        ]
+        if not events:
+            return
+
+        if self.broker is None:
+            self._deliver(events)
+            return
+        try:
+            await self.broker.publish(events)
+        except Exception as e:
+            logger.error(f"Failed to publish invoice events: {e}")
+            self._deliver(events)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "broker": type(self.broker).__name__ if self.broker else None,
+            "invoices": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+
+invoice_events = InvoiceEvents()
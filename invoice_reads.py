@@ -0,0 +1,125 @@
+import os
+from dataclasses import dataclass, field, replace
+from typing import Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from cache import TTLCache
+from models import Subcategory, User
+from models.invoice import Invoice as InvoiceModel, PaymentInvoice
+from models.product import Product as ProductModel
+from schemas.invoice import Invoice, InvoiceAuthed, PaymentInvoiceSchema
+from schemas.user import UserResponse
+
+# Конечные статусы: счет в них почти не меняется, но change_status все же может его перевести
+TERMINAL_STATUSES = frozenset({"canceled", "refunded", "order_ok", "order_error"})
+INVOICE_CACHE_SIZE = int(os.getenv("INVOICE_CACHE_SIZE", 10000))
+# Кэш локальный для воркера: в других воркерах счет сбрасывается событием invoice_events через брокер.
+# Без брокера (или если событие потерялось при переподключении) устаревшая копия живет не дольше TTL
+INVOICE_CACHE_TTL = float(os.getenv("INVOICE_CACHE_TTL", 60))
+
+
+@dataclass(frozen=True)
+class InvoiceDetail:
+    """
+    Счет с товаром и платежом в виде схем, без ORM-объектов. Данные пользователя меняются,
+    поэтому в закэшированный счет они не входят и читаются отдельно (get_invoice_user).
+    """
+    user_id: int
+    delivery_email: Optional[str]
+    invoice: Invoice
+    payment_invoice: Optional[PaymentInvoiceSchema]
+    # Пользователь, загруженный вместе со счетом; в кэш не попадает
+    user: Optional[User] = field(default=None, compare=False, repr=False)
+
+    @property
+    def is_terminal(self) -> bool:
+        return self.invoice.status.value in TERMINAL_STATUSES
+
+    def authed(self, user: User) -> InvoiceAuthed:
+        return InvoiceAuthed(**dict(self.invoice), delivery_email=self.delivery_email,
+                             user=UserResponse.model_validate(user))
+
+
+_terminal_invoices = TTLCache(maxsize=INVOICE_CACHE_SIZE, ttl=INVOICE_CACHE_TTL)
+
+
+def invoice_detail_query(uuid: str):
+    """
+    Счет, товар с подкатегорией и категорией, пользователь и платеж из majorofficial
+    одним SELECT: to-one связи через JOIN, платеж через LEFT OUTER JOIN.
+    """
+    return (
+        select(InvoiceModel, PaymentInvoice)
+        .outerjoin(PaymentInvoice, PaymentInvoice.gamemoneta_invoice_uuid == InvoiceModel.uuid)
+        .where(InvoiceModel.uuid == uuid)
+        .options(
+            joinedload(InvoiceModel.product).joinedload(ProductModel.subcategory).joinedload(Subcategory.category),
+            joinedload(InvoiceModel.user),
+        )
+    )
+
+
+def invoice_history_query(user_id: int, limit: int, cursor: Optional[int] = None,
+                          statuses: Optional[Sequence[str]] = None):
+    """
+    Страница истории заказов пользователя, новые первыми (keyset-пагинация по id).
+
+    uuid страницы выбираются только по индексу ix_invoices_user_history (user_id, id, status):
+    MySQL идет по нему в обратном порядке и останавливается на limit, не сортируя и не читая
+    строки таблицы. Полные строки и to-one связи подтягиваются JOIN к этой выборке.
+    """
+    page = select(InvoiceModel.uuid).where(InvoiceModel.user_id == user_id)
+    if cursor:
+        page = page.where(InvoiceModel.id < cursor)
+    if statuses:
+        page = page.where(InvoiceModel.status.in_(statuses))
+    page = page.order_by(InvoiceModel.id.desc()).limit(limit).subquery()
+
+    return (
+        select(InvoiceModel)
+        .join(page, page.c.uuid == InvoiceModel.uuid)
+        .order_by(InvoiceModel.id.desc())
+        .options(
+            joinedload(InvoiceModel.product).joinedload(ProductModel.subcategory).joinedload(Subcategory.category),
+            joinedload(InvoiceModel.user),
+        )
+    )
+
+
+async def get_invoice_detail(db: AsyncSession, uuid: str) -> Optional[InvoiceDetail]:
+    """Счета в конечных статусах отдаются из кэша без обращения к базе."""
+    detail = _terminal_invoices.get(uuid)
+    if detail is not None:
+        return detail
+
+    row = (await db.execute(invoice_detail_query(uuid))).unique().one_or_none()
+    if row is None:
+        return None
+
+    db_invoice, payment_invoice = row
+    detail = InvoiceDetail(
+        user_id=db_invoice.user_id,
+        delivery_email=db_invoice.delivery_email,
+        invoice=Invoice.model_validate(db_invoice),
+        payment_invoice=PaymentInvoiceSchema.model_validate(payment_invoice) if payment_invoice else None,
+        user=db_invoice.user,
+    )
+    if detail.is_terminal:
+        _terminal_invoices.set(uuid, replace(detail, user=None))
+    return detail
+
+
+async def get_invoice_user(db: AsyncSession, detail: InvoiceDetail) -> Optional[User]:
+    """Пользователь счета: без запроса, если счет только что загружен, иначе по первичному ключу."""
+    if detail.user is not None:
+        return detail.user
+    return await db.get(User, detail.user_id)
+
+
+def forget_invoice(*uuids: str) -> None:
+    """Сбрасывает счета в этом процессе; в остальных их сбрасывает событие из invoice_events.publish."""
+    for uuid in uuids:
+        _terminal_invoices.delete(uuid)
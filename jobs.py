@@ -0,0 +1,207 @@
+import asyncio
+import datetime as dt
+import logging
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import event, update, delete, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from models.outbox import OutboxJob, utcnow
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", 10))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 8))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", 5))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", 3600))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 300))
+JOB_KEEP_DONE_DAYS = int(os.getenv("JOB_KEEP_DONE_DAYS", 7))
+
+logger = logging.getLogger('Gamemoneta.site.jobs')
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str):
+    """
+    Регистрирует обработчик задач заданного типа. Обработчик получает payload задачи;
+    любое исключение считается неудачной попыткой.
+    """
+
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+
+    return decorator
+
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_BASE * 2 ** (attempts - 1), JOB_BACKOFF_MAX)
+    return delay + random.uniform(0, delay / 10)
+
+
+class JobWorker:
+    """
+    Пул асинхронных воркеров, разбирающих таблицу outbox_jobs.
+
+    Задачи захватываются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому воркеры
+    нескольких процессов uvicorn не выполняют одну задачу дважды. Задача, чей воркер упал,
+    снова становится доступной после окончания аренды (JOB_LEASE_SECONDS).
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, concurrency: int = JOB_WORKERS):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        if self._tasks or self.concurrency <= 0:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(), name=f"job-worker-{i}") for i in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self.wake()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Job worker iteration failed: {e}")
+                processed = 0
+
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        jobs = await self._claim()
+        for job in jobs:
+            await self._execute(*job)
+        return len(jobs)
+
+    async def _claim(self) -> list[tuple]:
+        now = utcnow()
+        async with self.session_factory() as db:
+            jobs = (await db.execute(
+                select(OutboxJob)
+                .where(or_(
+                    and_(OutboxJob.status == "pending", OutboxJob.available_at <= now),
+                    and_(OutboxJob.status == "running", OutboxJob.locked_until < now),
+                ))
+                .order_by(OutboxJob.available_at)
+                .limit(JOB_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )).scalars().all()
+
+            claimed = []
+            for job in jobs:
+                # Условие по attempts защищает от двойного захвата там, где нет SKIP LOCKED (SQLite в тестах)
+                result = await db.execute(
+                    update(OutboxJob)
+                    .where(OutboxJob.id == job.id, OutboxJob.attempts == job.attempts)
+                    .values(status="running", attempts=job.attempts + 1,
+                            locked_until=now + dt.timedelta(seconds=JOB_LEASE_SECONDS))
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    claimed.append((job.id, job.kind, job.payload, job.attempts + 1, job.max_attempts))
+            await db.commit()
+
+            return claimed
+
+    async def _execute(self, job_id: int, kind: str, payload: dict, attempts: int, max_attempts: int) -> None:
+        values: Dict[str, Any] = {"locked_until": None}
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{kind}'")
+            await handler(payload)
+        except Exception as e:
+            values["last_error"] = f"{type(e).__name__}: {e}"[:2000]
+            if attempts >= max_attempts:
+                values["status"] = "dead"
+                logger.error(f"Job {job_id} ({kind}) moved to dead letters after {attempts} attempts: {e}")
+            else:
+                values["status"] = "pending"
+                values["available_at"] = utcnow() + dt.timedelta(seconds=backoff_delay(attempts))
+        else:
+            values["status"] = "done"
+
+        async with self.session_factory() as db:
+            await db.execute(update(OutboxJob).where(OutboxJob.id == job_id).values(**values))
+            await db.commit()
+
+
+job_worker = JobWorker()
+
+
+def enqueue(db: AsyncSession, kind: str, payload: Dict[str, Any], delay: float = 0,
+            max_attempts: int = JOB_MAX_ATTEMPTS) -> OutboxJob:
+    """
+    Добавляет задачу в текущую транзакцию. Задача станет видна воркерам только после commit
+    этой сессии; если транзакция откатится, задача не выполнится.
+    """
+    job = OutboxJob(
+        kind=kind,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        max_attempts=max_attempts,
+        available_at=utcnow() + dt.timedelta(seconds=delay),
+    )
+    db.add(job)
+    if not event.contains(db.sync_session, "after_commit", _wake_after_commit):
+        event.listen(db.sync_session, "after_commit", _wake_after_commit)
+    return job
+
+
+def _wake_after_commit(session) -> None:
+    job_worker.wake()
+
+
+async def retry_dead_jobs(kind: Optional[str] = None) -> int:
+    """Возвращает задачи из dead letters в очередь."""
+    query = update(OutboxJob).where(OutboxJob.status == "dead")
+    if kind:
+        query = query.where(OutboxJob.kind == kind)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            query.values(status="pending", attempts=0, available_at=utcnow(), last_error=None)
+        )
+        await db.commit()
+    job_worker.wake()
+    return result.rowcount
+
+
+async def prune_done_jobs() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(OutboxJob).where(
+                OutboxJob.status == "done",
+                OutboxJob.available_at < utcnow() - dt.timedelta(days=JOB_KEEP_DONE_DAYS),
+            )
+        )
+        await db.commit()
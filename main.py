@@ -1,9 +1,23 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from typing import Optional
+
+from fastapi import FastAPI, Request, Header, HTTPException, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes import auth, users, profile, products, oauth, categories, subcategories, orders, alias, invoice, lava, gifts
+from routes import auth, users, profile, products, oauth, categories, subcategories, orders, alias, invoice, lava, gifts, \
+    catalog
 from log_notifier import exception_handler
-from utils import scheduler, IS_TEST
+from utils import IS_TEST
+from database import engine, pool_stats, dispose_engine
+from jobs import job_worker
+from cache import close_shared_backend, catalog_invalidations
+from http_clients import close_http_clients, upstream_stats
+from passwords import password_hasher
+from steam_checker import steam_login_checker
+from currency_rates import currency_rates
+from invoice_events import invoice_events
+from metrics import MetricsMiddleware, render_metrics, METRICS_TOKEN
+from rate_limit import RateLimitMiddleware, CoalescingMiddleware
+import sql_profiler
 
 if IS_TEST:
     app = FastAPI(docs_url="/api/docs")
@@ -37,6 +51,11 @@ else:
                     "http://81.177.135.164", "http://90.189.147.33", "http://147.30.70.48", "http://195.161.68.242",
                     "http://62.122.172.72", "http://62.122.173.38", "http://91.227.144.73"] # LAVA ip-адреса
 
+# Внутри CORS, чтобы ответы 429 и повторенные ответы получали CORS-заголовки своего запроса.
+# Лимитер снаружи объединения запросов: ожидающие копию ответа тоже расходуют бюджет
+app.add_middleware(CoalescingMiddleware)
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
@@ -45,6 +64,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if sql_profiler.SQL_PROFILE:
+    sql_profiler.attach(engine)
+    app.add_middleware(sql_profiler.SQLProfilerMiddleware)
+    app.include_router(sql_profiler.router, prefix="/api/debug")
+
+# Добавлен последним - внешний слой, замеряет запрос целиком, включая CORS и проверку origin
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth.router, prefix="/api/auth")
 app.include_router(users.router, prefix="/api/users")
 app.include_router(profile.router, prefix="/api/profile")
@@ -57,6 +84,7 @@ app.include_router(alias.router, prefix="/api/alias")
 app.include_router(invoice.router, prefix="/api/invoice")
 app.include_router(lava.router, prefix="/api/lava")
 app.include_router(gifts.router, prefix="/api/gifts")
+app.include_router(catalog.router, prefix="/api/catalog")
 
 tags_metadata = [
     {
@@ -104,12 +132,50 @@ tags_metadata = [
     },
 ]
 
+
+def has_metrics_token(authorization: Optional[str]) -> bool:
+    return authorization == f"Bearer {METRICS_TOKEN}"
+
+
+@app.get("/api/health", include_in_schema=False)
+async def health(authorization: Optional[str] = Header(None)):
+    # Публично - только признак жизни; внутренняя статистика - по тому же токену, что и /metrics
+    if not METRICS_TOKEN or not has_metrics_token(authorization):
+        return {"status": "ok"}
+    return {"status": "ok", "db_pool": pool_stats(), "upstreams": upstream_stats(),
+            "password_hasher": password_hasher.stats, "currency_rates": currency_rates.stats,
+            "invoice_events": invoice_events.stats, "catalog_invalidations": catalog_invalidations.stats}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not has_metrics_token(authorization):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("startup")
+async def startup_event():
+    await job_worker.start()
+    await currency_rates.start()
+    await invoice_events.start()
+    await catalog_invalidations.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_worker.stop()
+    await steam_login_checker.stop()
+    await currency_rates.stop()
+    await invoice_events.stop()
+    await catalog_invalidations.stop()
+    await close_http_clients()
+    await close_shared_backend()
+    password_hasher.close()
+    await dispose_engine()
+
+
 if __name__ == "__main__":
     import uvicorn
 
     uvicorn.run(app, host="0.0.0.0", port=8000)
-
-
-    @app.on_event("shutdown")
-    def shutdown_event():
-        scheduler.shutdown()
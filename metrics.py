@@ -0,0 +1,180 @@
+import bisect
+import contextvars
+import math
+import os
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry.append(self)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labelnames, labelvalues, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Имя счетчика должно оканчиваться на _total: в text format 0.0.4 TYPE называет семейство по имени сэмпла."""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        if not name.endswith("_total"):
+            raise ValueError(f"Counter name must end with _total: {name}")
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield "", self.labelnames, labelvalues, value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self):
+        for labelvalues, value in self._values.items():
+            yield "", self.labelnames, labelvalues, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [счетчики по бакетам (не накопительные) + +Inf, сумма]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        entry = self._values.get(labelvalues)
+        if entry is None:
+            entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        labelnames = self.labelnames + ("le",)
+        for labelvalues, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield "_bucket", labelnames, (*labelvalues, _format_value(bound)), cumulative
+            yield "_sum", self.labelnames, labelvalues, total
+            yield "_count", self.labelnames, labelvalues, cumulative
+
+
+registry: list[Metric] = []
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status.",
+                        ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being processed.")
+SQL_QUERIES_PER_REQUEST = Histogram("http_request_sql_queries", "SQL statements executed per HTTP request.",
+                                    ("method", "route"), buckets=QUERY_COUNT_BUCKETS)
+DB_ACQUIRE = Histogram("db_connection_acquire_seconds", "Time to get a connection from the pool.",
+                       buckets=DB_BUCKETS)
+UPSTREAM_LATENCY = Histogram("upstream_request_duration_seconds", "Outbound HTTP call latency.",
+                             ("upstream", "status"))
+
+_sql_counter: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("sql_counter", default=None)
+
+
+def count_sql_query() -> None:
+    """Вызывается из before_cursor_execute; считает запросы текущего HTTP-запроса."""
+    counter = _sql_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: число запросов, латентность и количество SQL-запросов по шаблону маршрута
+    (/api/products/{uuid}, а не конкретный uuid), чтобы число серий не зависело от данных.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        counter = [0]
+        token = _sql_counter.set(counter)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _sql_counter.reset(token)
+
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route_path, str(status_code))
+            HTTP_LATENCY.observe(elapsed, method, route_path)
+            SQL_QUERIES_PER_REQUEST.observe(counter[0], method, route_path)
@@ -10,4 +10,6 @@ from models.invoice import *
 from models.order import *
 from models.order_item import *
 
-from models.lava_invoice import *
\ No newline at end of file
+from models.lava_invoice import *
+
+from models.outbox import *
\ No newline at end of file
@@ -1,5 +1,5 @@
 from sqlalchemy import (Column, Integer, String, Enum, TIMESTAMP, CHAR, func, ForeignKey, JSON, Boolean,
-                        DECIMAL, Text)
+                        DECIMAL, Text, Index)
 from sqlalchemy.orm import relationship
 from uuid import uuid4
 from database import Base
@@ -7,6 +7,10 @@ from database import Base
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_user_history", "user_id", "id", "status"),
+        Index("ix_invoices_status_id", "status", "id"),
+    )
 
     uuid = Column(CHAR(36), primary_key=True, nullable=False, default=lambda: str(uuid4()))
 
@@ -21,6 +25,8 @@ class Invoice(Base):
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp(), nullable=False)
     status = Column(Enum("paid", "wait", "canceled", "refunded", "error", "process", "order_ok", "order_error"),
                     default="wait", nullable=False)
+    claim_token = Column(CHAR(36), nullable=True, index=True)
+    claim_expires_at = Column(TIMESTAMP, nullable=True)
 
     product = relationship("Product", back_populates="invoices")
     user = relationship("User", back_populates="invoices")
@@ -0,0 +1,31 @@
+import datetime as dt
+
+from sqlalchemy import Column, Integer, String, Enum, DateTime, TIMESTAMP, JSON, Text, Index, func
+
+from database import Base
+
+
+def utcnow() -> dt.datetime:
+    return dt.datetime.now(dt.UTC).replace(tzinfo=None)
+
+
+class OutboxJob(Base):
+    """
+    Отложенное действие (письмо, запрос во внешний сервис), записанное в той же транзакции,
+    что и изменение, которое его порождает. Выполняется воркерами из jobs.py.
+    """
+    __tablename__ = "outbox_jobs"
+    __table_args__ = (
+        Index("ix_outbox_jobs_status_available_at", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(Enum("pending", "running", "done", "dead"), default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    available_at = Column(DateTime, default=utcnow, nullable=False)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp(), nullable=False)
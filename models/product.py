@@ -80,6 +80,7 @@ class Product(Base):
     description = Column(Text, nullable=True)
     image_url = Column(String, nullable=True)
     preview_image_url = Column(String, nullable=True)
+    steam_game_id = Column(Integer, nullable=True, unique=True)  # только у подарков Steam, ключ импорта
 
     subcategory = relationship("Subcategory", back_populates="products")
     order_items = relationship("OrderItem", back_populates="product")
@@ -1,12 +1,15 @@
-from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy import Column, CHAR, Integer, ForeignKey, DateTime, TIMESTAMP, func
 from sqlalchemy.orm import relationship
 from database import Base
 
 
 class TokenBlacklist(Base):
+    """Использованные одноразовые токены. Строки удаляются по expires_at, после которого токен и так недействителен."""
     __tablename__ = "token_blacklist"
 
-    token = Column(String(500), primary_key=True, nullable=False)
+    token_hash = Column(CHAR(64), primary_key=True, nullable=False)  # sha256(token).hexdigest()
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(TIMESTAMP, server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="TokensBlacklisted")
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# При изменении BCRYPT_ROUNDS старые хэши пересчитываются при следующем успешном входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasher:
+    """
+    Выполняет bcrypt вне event loop в отдельном пуле потоков.
+
+    bcrypt отпускает GIL на время вычисления, поэтому потоков достаточно, и хэширование
+    не блокирует остальные запросы. Одновременно считается не больше workers хэшей,
+    остальные ждут в очереди; ее глубина видна в stats.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = PASSWORD_HASH_WORKERS):
+        self.context = context
+        self.workers = max(workers, 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.max_waiting = 0
+        self.running = 0
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        self.total_wait_seconds += started - queued_at
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.running -= 1
+            self.calls += 1
+            self.total_seconds += time.perf_counter() - started
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Возвращает (valid, new_hash); new_hash не None, если хэш сделан с устаревшими параметрами."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "calls": self.calls,
+            "avg_seconds": round(self.total_seconds / self.calls, 6) if self.calls else 0.0,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.calls, 6) if self.calls else 0.0,
+        }
+
+
+password_hasher = PasswordHasher(pwd_context)
@@ -0,0 +1,108 @@
+import os
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional
+
+from currency_rates import RatesSnapshot, currency_rates
+from schemas.product import CurrencyCode
+
+# Цены в базе - в рублях; курсы в RatesSnapshot - рублей за единицу валюты
+BASE_CURRENCY = "RUB"
+PRICE_DECIMALS = {"RUB": 2, "KZT": 0, "USD": 2}
+# Ключи в items/item/default_value опций, значения которых - цены
+OPTION_PRICE_KEYS = frozenset(key.strip() for key in os.getenv("OPTION_PRICE_KEYS", "price").split(",") if key.strip())
+PRICE_TABLE_SIZE = int(os.getenv("PRICE_TABLE_SIZE", 50000))
+
+OPTION_PRICE_FIELDS = ("items", "item", "default_value")
+
+
+def convert_price(amount: Any, currency: CurrencyCode, snapshot: RatesSnapshot) -> Any:
+    if amount is None or isinstance(amount, bool) or not isinstance(amount, (int, float, Decimal)):
+        return amount
+
+    value = Decimal(str(amount))
+    if currency != BASE_CURRENCY:
+        value /= Decimal(str(getattr(snapshot, currency)))
+    return float(value.quantize(Decimal(1).scaleb(-PRICE_DECIMALS[currency]), rounding=ROUND_HALF_UP))
+
+
+def _convert_nested(value: Any, currency: CurrencyCode, snapshot: RatesSnapshot) -> Any:
+    if isinstance(value, list):
+        return [_convert_nested(item, currency, snapshot) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: convert_price(item, currency, snapshot) if key in OPTION_PRICE_KEYS
+            else _convert_nested(item, currency, snapshot)
+            for key, item in value.items()
+        }
+    return value
+
+
+class PriceTable:
+    """
+    Цены товаров, уже пересчитанные в валюту и округленные: (id товара, валюта, исходные цены) -> поля.
+
+    Исходные цены входят в ключ, поэтому товар, измененный в любом воркере, пересчитывается
+    при первом же чтении новых данных, без общей инвалидации. Таблица действительна для
+    одного снимка курсов; при его смене она очищается и заполняется заново по мере запросов.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._version: Optional[int] = None
+        self._entries: Dict[tuple, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _compute(self, product: dict, currency: CurrencyCode, snapshot: RatesSnapshot) -> dict:
+        localized = {}
+        if "price" in product:
+            localized["price"] = convert_price(product["price"], currency, snapshot)
+        if "options" in product:
+            localized["options"] = [
+                {field: _convert_nested(option.get(field), currency, snapshot) for field in OPTION_PRICE_FIELDS}
+                for option in product["options"]
+            ]
+        return localized
+
+    def localized(self, product: dict, currency: CurrencyCode, snapshot: RatesSnapshot) -> dict:
+        if snapshot.version != self._version:
+            self._version = snapshot.version
+            self._entries.clear()
+
+        # Облегченные карточки содержат не все поля, поэтому набор полей - тоже часть ключа
+        key = (
+            product["id"], currency,
+            "price" in product, product.get("price"),
+            "options" in product,
+            repr([[option.get(field) for field in OPTION_PRICE_FIELDS] for option in product["options"]])
+            if "options" in product else None,
+        )
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._compute(product, currency, snapshot)
+            # Старые ключи измененных товаров больше не читаются - при переполнении начинаем заново
+            if len(self._entries) >= self.maxsize:
+                self._entries.clear()
+            self._entries[key] = entry
+        else:
+            self.hits += 1
+        return entry
+
+    @property
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+price_table = PriceTable(maxsize=PRICE_TABLE_SIZE)
+
+
+def localize_products(products: List[dict], currency: CurrencyCode) -> None:
+    """Заменяет цены в сериализованных товарах (model_dump) ценами в currency."""
+    snapshot = currency_rates.snapshot
+    for product in products:
+        localized = price_table.localized(product, currency, snapshot)
+        if "price" in localized:
+            product["price"] = localized["price"]
+        for option, fields in zip(product.get("options", ()), localized.get("options", ())):
+            option.update(fields)
@@ -0,0 +1,285 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from starlette.routing import compile_path
+
+from cache import TTLCache, RedisBackend, shared_backend
+from metrics import Counter
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("1", "true", "yes")
+# За nginx адрес клиента приходит в X-Forwarded-For; без прокси заголовку верить нельзя
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "").lower() in ("1", "true", "yes")
+RATE_LIMIT_BUCKETS = int(os.getenv("RATE_LIMIT_BUCKETS", 100000))
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1").lower() in ("1", "true", "yes")
+COALESCE_MAX_BODY = int(os.getenv("COALESCE_MAX_BODY", 1024 * 1024))
+# Только обычные JSON-ответы: потоковые эндпоинты (SSE, /api/catalog/export) объединять нельзя
+COALESCE_PREFIXES = ("/api/products", "/api/gifts", "/api/categories", "/api/subcategories", "/api/invoice/get/")
+
+logger = logging.getLogger('Gamemoneta.site.rate_limit')
+
+RATE_LIMITED = Counter("http_rate_limited_requests_total", "Requests rejected by the rate limiter.", ("rule",))
+COALESCED = Counter("http_coalesced_requests_total",
+                    "GET requests answered with a concurrent identical request's response.")
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Бюджет на один IP: burst запросов сразу, дальше per_minute в минуту. Пути правила делят один бюджет."""
+    name: str
+    per_minute: float
+    burst: int
+    routes: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+    def with_env(self) -> "RateLimitRule":
+        """RATE_LIMIT_<NAME>="per_minute,burst" переопределяет бюджет, например RATE_LIMIT_STEAM=30,10."""
+        value = os.getenv(f"RATE_LIMIT_{self.name.upper()}")
+        if not value:
+            return self
+        per_minute, burst = value.split(",")
+        return RateLimitRule(self.name, float(per_minute), int(burst), self.routes)
+
+
+RULES = [
+    # Каждая проверка - платный запрос к Steam API
+    RateLimitRule("steam", per_minute=12, burst=6, routes=(
+        ("GET", "/api/invoice/check_login"),
+        ("POST", "/api/invoice/check_login/jobs"),
+        ("GET", "/api/invoice/check_login/stream"),
+        ("GET", "/api/invoice/check_steam_link"),
+    )),
+    # Отправляет письмо
+    RateLimitRule("email", per_minute=3, burst=3, routes=(
+        ("POST", "/api/auth/password_reset_request"),
+    )),
+    # Подбор паролей и токенов сброса; каждый вызов еще и считает bcrypt
+    RateLimitRule("credentials", per_minute=10, burst=10, routes=(
+        ("POST", "/api/auth/login"),
+        ("POST", "/api/auth/register"),
+        ("POST", "/api/auth/password_reset"),
+        ("POST", "/api/auth/check_reset_token"),
+        ("POST", "/api/auth/email_reset"),
+    )),
+    # Создает счет, счет в LAVA и, для новой почты, пользователя
+    RateLimitRule("invoice_create", per_minute=10, burst=10, routes=(
+        ("POST", "/api/invoice/"),
+    )),
+    RateLimitRule("webhook", per_minute=600, burst=200, routes=(
+        ("POST", "/api/lava/webhook"),
+        ("POST", "/api/invoice/change_status"),
+    )),
+]
+DEFAULT_RULE = RateLimitRule("default", per_minute=1200, burst=100)
+
+
+class RateLimitBackend:
+    async def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        """Забирает токен из корзины key. Returns: (разрешен ли запрос, через сколько секунд появится токен)."""
+        raise NotImplementedError
+
+
+class LocalTokenBuckets(RateLimitBackend):
+    """Корзины в памяти процесса; у каждого воркера uvicorn свои."""
+
+    def __init__(self, maxsize: int):
+        self._buckets = TTLCache(maxsize=maxsize, ttl=3600)
+
+    async def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key) or (rule.burst, now)
+        tokens = min(rule.burst, tokens + (now - updated) * rule.rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Корзина, которая успеет наполниться, не нужна: отсутствующая считается полной
+        self._buckets.set(key, (tokens, now), ttl=rule.burst / rule.rate)
+        return allowed, 0.0 if allowed else (1 - tokens) / rule.rate
+
+
+# Атомарно в Redis; время берется из Redis, чтобы часы воркеров не влияли на бюджет
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBuckets(RateLimitBackend):
+    """Общие для всех процессов корзины в хранилище SHARED_CACHE_URL."""
+
+    def __init__(self, backend: RedisBackend):
+        self.prefix = backend.prefix + "ratelimit:"
+        self._script = backend.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(keys=[self.prefix + key], args=[rule.rate, rule.burst])
+        return bool(allowed), 0.0 if allowed else (1 - float(tokens)) / rule.rate
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """
+    Token bucket на пару (IP, правило). Правило ищется по методу и шаблону пути из RULES,
+    остальные запросы расходуют общий бюджет DEFAULT_RULE. При превышении - 429 с Retry-After.
+
+    Если настроен SHARED_CACHE_URL, бюджеты общие для всех воркеров; при ошибке хранилища
+    лимитер переходит на локальные корзины, а не отклоняет запросы.
+    """
+
+    def __init__(self, app, rules: Optional[List[RateLimitRule]] = None, default_rule: RateLimitRule = DEFAULT_RULE):
+        self.app = app
+        self.default_rule = default_rule.with_env()
+        self.routes: List[Tuple[str, re.Pattern, RateLimitRule]] = [
+            (method, compile_path(path)[0], rule.with_env())
+            for rule in (RULES if rules is None else rules)
+            for method, path in rule.routes
+        ]
+        self.local = LocalTokenBuckets(RATE_LIMIT_BUCKETS)
+        self._shared: Optional[RateLimitBackend] = None
+        self._shared_failing = False
+
+    def rule_for(self, method: str, path: str) -> RateLimitRule:
+        for rule_method, pattern, rule in self.routes:
+            if rule_method == method and pattern.match(path):
+                return rule
+        return self.default_rule
+
+    def shared(self) -> Optional[RateLimitBackend]:
+        if self._shared is None:
+            backend = shared_backend()
+            if isinstance(backend, RedisBackend):
+                self._shared = RedisTokenBuckets(backend)
+        return self._shared
+
+    async def take(self, key: str, rule: RateLimitRule) -> Tuple[bool, float]:
+        shared = self.shared()
+        if shared is not None:
+            try:
+                result = await shared.take(key, rule)
+                self._shared_failing = False
+                return result
+            except Exception as e:
+                # Пишем один раз на сбой, а не на каждый запрос
+                if not self._shared_failing:
+                    logger.error(f"Shared rate limiter failed, using local buckets: {e}")
+                self._shared_failing = True
+        return await self.local.take(key, rule)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+
+        rule = self.rule_for(scope["method"], scope["path"])
+        allowed, retry_after = await self.take(f"{rule.name}:{client_ip(scope)}", rule)
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMITED.inc(rule.name)
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+class _Flight:
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.messages: Optional[list] = None
+
+
+# Заголовки, от которых зависит ответ: запросы с разными значениями не объединяются
+COALESCE_KEY_HEADERS = (b"authorization", b"cookie", b"if-none-match", b"accept-encoding")
+
+
+class CoalescingMiddleware:
+    """
+    Одинаковые одновременные GET-запросы (путь, query и COALESCE_KEY_HEADERS) выполняются один раз:
+    первый выполняется как обычно, остальные ждут его и получают копию ответа.
+    Если первый упал или ответ больше COALESCE_MAX_BODY, ожидавшие выполняются сами.
+    """
+
+    def __init__(self, app, prefixes: Tuple[str, ...] = COALESCE_PREFIXES, max_body: int = COALESCE_MAX_BODY):
+        self.app = app
+        self.prefixes = prefixes
+        self.max_body = max_body
+        self._flights: Dict[tuple, _Flight] = {}
+
+    def key(self, scope) -> tuple:
+        headers = dict((name, value) for name, value in scope["headers"] if name in COALESCE_KEY_HEADERS)
+        return scope["path"], scope["query_string"], *(headers.get(name) for name in COALESCE_KEY_HEADERS)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "GET" or not COALESCE_ENABLED
+                or not scope["path"].startswith(self.prefixes)):
+            return await self.app(scope, receive, send)
+
+        key = self.key(scope)
+        flight = self._flights.get(key)
+        if flight is not None:
+            await flight.done.wait()
+            if flight.messages is None:
+                return await self.app(scope, receive, send)
+            COALESCED.inc()
+            for message in flight.messages:
+                await send(message)
+            return
+
+        flight = self._flights[key] = _Flight()
+        recorded: Optional[list] = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal recorded, size
+            if recorded is not None:
+                size += len(message.get("body", b""))
+                if size <= self.max_body:
+                    recorded.append(message)
+                else:
+                    recorded = None
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+            flight.messages = recorded
+        finally:
+            del self._flights[key]
+            flight.done.set()
@@ -1,19 +1,22 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from models.product import Alias as AliasModel
 from schemas.alias import AliasesGetAllResponse
 from database import get_db
+from cache import catalog_cache
 
 router = APIRouter()
 
 
 @router.get("/", response_model=AliasesGetAllResponse, tags=["products"])
-async def get_all_aliases(db: AsyncSession = Depends(get_db)):
-    aliases = (await db.execute(select(AliasModel))).scalars().all()
+async def get_all_aliases(request: Request, db: AsyncSession = Depends(get_db)):
+    async def build() -> bytes:
+        aliases = (await db.execute(select(AliasModel))).scalars().all()
 
-    return {
-        'aliases': aliases,
-        'success': len(aliases) > 0
-    }
+        return AliasesGetAllResponse.model_validate(
+            {'aliases': aliases, 'success': len(aliases) > 0}, from_attributes=True
+        ).model_dump_json().encode()
+
+    return await catalog_cache.response(request, "aliases", build)
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.future import select
 
-from models import TokenBlacklist
 from schemas.auth import *
-from utils import pwd_context, create_access_token, verify_token, verify_password_reset_token, send_email
+from utils import password_hasher, create_access_token, verify_token, verify_password_reset_token, enqueue_email, \
+    invalidate_user, blacklist_token
 from models.user import User
 from schemas.user import UserCreate, UserLogin, UserTokenResponse, SessionCheckResponse
 from database import get_db
@@ -26,7 +27,7 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 
     new_user = User(
         email=user.email,
-        hashed_password=pwd_context.hash(user.password),
+        hashed_password=await password_hasher.hash(user.password),
         name=user.name
     )
     db.add(new_user)
@@ -42,9 +43,17 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     existing_user = (await db.execute(select(User).where(User.email == user.email))).scalar_one_or_none()
 
-    if not existing_user or not pwd_context.verify(user.password, existing_user.hashed_password):
+    if not existing_user:
         return UserTokenResponse(error='Неверные почта или пароль')
 
+    valid, new_hash = await password_hasher.verify_and_update(user.password, existing_user.hashed_password)
+    if not valid:
+        return UserTokenResponse(error='Неверные почта или пароль')
+
+    if new_hash:
+        existing_user.hashed_password = new_hash
+        await db.commit()
+
     token = create_access_token({"sub": str(existing_user.id)})
 
     return UserTokenResponse(token=token)
@@ -70,17 +79,16 @@ async def request_password_reset(body: InitiatePasswordResetRequest, db: AsyncSe
         data={"sub": str(user.id), "type": "password_reset"},
         expires_delta=timedelta(minutes=30)
     )
-    email_sent = await send_email(
+    enqueue_email(
+        db,
         recipient_email=body.email,
         template_type="password_reset",
         subject="Смена пароля",
         email_data={"reset_token": reset_token}
     )
+    await db.commit()
 
-    if email_sent:
-        return InitiatePasswordResetResponse()
-    else:
-        return InitiatePasswordResetResponse(message="Возникла ошибка. Попробуйте позже.")
+    return InitiatePasswordResetResponse()
 
 
 @router.post("/password_reset", response_model=PasswordResetResponse, tags=["auth"])
@@ -109,15 +117,18 @@ async def reset_password(body: PasswordResetRequest, db: AsyncSession = Depends(
                 detail="User not found"
             )
 
-        user.hashed_password = pwd_context.hash(body.new_password)
-        blacklisted_token = TokenBlacklist(token=body.token, user_id=user_id)
-        db.add(blacklisted_token)
+        user.hashed_password = await password_hasher.hash(body.new_password)
+        blacklist_token(db, body.token, payload, user_id=user.id)
 
         await db.commit()
+        await invalidate_user(user.id)
 
         return PasswordResetResponse(message="Пароль успешно обновлен", success=True)
     except HTTPException as e:
         return PasswordResetResponse(message=e.detail, success=False)
+    except IntegrityError:
+        # Тот же токен одновременно использован в другом запросе
+        return PasswordResetResponse(message="Token already used", success=False)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -170,6 +181,7 @@ async def reset_email(request: EmailResetReq, db: AsyncSession = Depends(get_db)
 
         user.email = request.new_email
         await db.commit()
+        await invalidate_user(user.id)
         return EmailResetRes(message="Email успешно изменен", success=True)
 
     except Exception as e:
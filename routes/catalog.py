@@ -0,0 +1,44 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from catalog_io import import_catalog, export_catalog, iter_lines, parse_ndjson, parse_csv, to_ndjson, to_csv
+from database import get_db
+from schemas.product import CatalogImportResponse
+from cache import invalidate_catalog
+
+router = APIRouter()
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+@router.get("/export", tags=["products"])
+async def export_products(format: Literal["ndjson", "csv"] = "ndjson",
+                          subcategory_id: Optional[int] = Query(None)):
+    """
+    Потоковая выгрузка каталога: товары с опциями, алиасами, FAQ и полями доставки.
+    Формат совпадает с /import, так что выгрузку можно загрузить обратно.
+    """
+    items = export_catalog(subcategory_id)
+    body = to_ndjson(items) if format == "ndjson" else to_csv(items)
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="catalog.{format}"'})
+
+
+@router.post("/import", response_model=CatalogImportResponse, tags=["products"])
+async def import_products(request: Request, format: Literal["ndjson", "csv"] = "ndjson",
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Потоковая загрузка каталога из тела запроса (NDJSON или CSV) с commit пачками.
+    При ошибке загрузка останавливается, в ответе - число уже записанных строк и номер строки с ошибкой.
+    """
+    lines = iter_lines(request.stream())
+    rows = parse_ndjson(lines) if format == "ndjson" else parse_csv(lines)
+    try:
+        imported, chunks, error = await import_catalog(db, rows)
+    finally:
+        invalidate_catalog()
+
+    return CatalogImportResponse(success=error is None, imported=imported, chunks=chunks, error=error)
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
 from database import get_db
+from cache import catalog_cache, invalidate_catalog
 
 from models.category import Category as CategoryModel
 from schemas.category import Category, CategoryCreate, CategoryUpdate, CategoryListResponse
@@ -14,9 +15,12 @@ router = APIRouter()
 
 
 @router.get("/", response_model=CategoryListResponse, status_code=status.HTTP_200_OK, tags=["categories"])
-async def get_categories(db: AsyncSession = Depends(get_db)) -> CategoryListResponse:
-    categories = (await db.execute(select(CategoryModel))).scalars().all()
-    return CategoryListResponse(categories=categories)
+async def get_categories(request: Request, db: AsyncSession = Depends(get_db)) -> Response:
+    async def build() -> bytes:
+        categories = (await db.execute(select(CategoryModel))).scalars().all()
+        return CategoryListResponse(categories=categories).model_dump_json().encode()
+
+    return await catalog_cache.response(request, "categories", build)
 
 
 @router.post("/", response_model=Category, status_code=status.HTTP_201_CREATED, tags=["categories"])
@@ -24,13 +28,14 @@ async def create_category(category: CategoryCreate, db: AsyncSession = Depends(g
     new_category = CategoryModel(**category.model_dump())
     db.add(new_category)
     await db.commit()
+    invalidate_catalog()
     await db.refresh(new_category)
     return new_category
 
 
 @router.put("/{uid}", response_model=Category, status_code=status.HTTP_200_OK, tags=["categories"])
 async def update_category(uid: int, category: CategoryUpdate, db: AsyncSession = Depends(get_db)) -> Category:
-    db_category = db.get(CategoryModel, uid)
+    db_category = await db.get(CategoryModel, uid)
     if not db_category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
 
@@ -38,18 +43,20 @@ async def update_category(uid: int, category: CategoryUpdate, db: AsyncSession =
         setattr(db_category, key, value)
 
     await db.commit()
+    invalidate_catalog()
     await db.refresh(db_category)
     return Category.model_validate(db_category)
 
 
 @router.delete("/{uid}", status_code=status.HTTP_204_NO_CONTENT, tags=["categories"])
 async def delete_category(uid: int, db: AsyncSession = Depends(get_db)) -> None:
-    db_category = db.get(CategoryModel, uid)
+    db_category = await db.get(CategoryModel, uid)
     if not db_category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
 
     await db.delete(db_category)
     await db.commit()
+    invalidate_catalog()
     return
 
 
@@ -82,5 +89,6 @@ async def create_subcategory(category_id: int, subcategory: SubcategoryCreate, d
     new_subcategory = SubcategoryModel(category_id=category_id, **subcategory.model_dump())
     db.add(new_subcategory)
     await db.commit()
+    invalidate_catalog()
     await db.refresh(new_subcategory)
     return new_subcategory
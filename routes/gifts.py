@@ -1,110 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import joinedload
 
 from models import Subcategory as SubcategoryModel
-from models.product import Product as ProductModel, ProductOption as ProductOptionModel, ProductOption, Product, Alias
-from schemas.product import GiftListGetAllResponse, GiftGetByIdResponse, BatchGiftCreateRequest, BatchGiftCreateResponse
+from models.product import Product as ProductModel, ProductOption as ProductOptionModel
+from schemas.product import GiftListGetAllResponse, GiftGetByIdResponse, BatchGiftCreateRequest, \
+    BatchGiftCreateResponse, GiftCardListResponse, CurrencyCode
+from routes.products import parse_product_fields, build_product_list, localized_json
 from database import get_db
-from utils import currencies
+from currency_rates import currency_rates
+from cache import catalog_cache, invalidate_catalog
+from gift_import import import_gifts
 
 router = APIRouter()
 
 
 @router.get("/", response_model=GiftListGetAllResponse, tags=["gifts"])
-async def get_all_gifts(db: AsyncSession = Depends(get_db)):
-    gifts = (
-        await db.execute(
-            select(ProductModel).where(ProductModel.subcategory_id == 2)
-            .options(
-                joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
-                selectinload(ProductModel.aliases),
-                selectinload(ProductModel.options),
-            )
-        )
-    ).unique().scalars().all()
-
-    return {
-        'gifts': list(gifts),
-        'success': len(list(gifts)) > 0
-    }
+async def get_all_gifts(
+        request: Request,
+        cursor: Optional[int] = Query(None, description="The ID of the last fetched gift"),
+        limit: Optional[int] = Query(None, description="Number of gifts to fetch", gt=0, le=500),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+        fields: Optional[str] = Query(None, description="Comma-separated fields, e.g. id,name,price,preview_image_url"),
+        currency: Optional[CurrencyCode] = Query(None, description="Return prices converted to this currency"),
+        db: AsyncSession = Depends(get_db)
+):
+    columns = parse_product_fields(fields)
+    filters = dict(cursor=cursor, limit=limit, min_price=min_price, max_price=max_price)
+
+    async def build() -> bytes:
+        return await build_product_list(db, 'gifts', GiftListGetAllResponse, GiftCardListResponse, columns,
+                                        query_filter=ProductModel.subcategory_id == 2, currency=currency, **filters)
+
+    cache_key = f"gifts:{sorted(filters.items())}:{columns}:{currency}"
+    return await catalog_cache.response(request, cache_key, build)
 
 
 @router.get("/{uuid}", response_model=GiftGetByIdResponse, tags=["gifts"])
-async def get_gift_by_id(uuid: int, db: AsyncSession = Depends(get_db)):
-    db_gift = (
-        await db.execute(
-            select(ProductModel)
-            .where(ProductModel.id == uuid)
-            .options(
-                joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
-                joinedload(ProductModel.options),
-                joinedload(ProductModel.delivery_inputs),
-                joinedload(ProductModel.faq),
-                joinedload(ProductModel.aliases),
+async def get_gift_by_id(
+        uuid: int,
+        request: Request,
+        currency: Optional[CurrencyCode] = Query(None, description="Return prices converted to this currency"),
+        db: AsyncSession = Depends(get_db)
+):
+    async def build() -> bytes:
+        db_gift = (
+            await db.execute(
+                select(ProductModel)
+                .where(ProductModel.id == uuid)
+                .options(
+                    joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
+                    joinedload(ProductModel.options),
+                    joinedload(ProductModel.delivery_inputs),
+                    joinedload(ProductModel.faq),
+                    joinedload(ProductModel.aliases),
+                )
             )
+        ).unique().scalar_one_or_none()
+        if not db_gift:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        response = GiftGetByIdResponse.model_validate(
+            {'data': db_gift, 'success': True, 'currencies': currency_rates.snapshot.as_dict()}, from_attributes=True
         )
-    ).unique().scalar_one_or_none()
-    if not db_gift:
-        raise HTTPException(status_code=404, detail="Product not found")
+        return localized_json(response, 'data', currency)
 
-    return {'data': db_gift, 'success': True, 'currencies': currencies}
+    return await catalog_cache.response(request, f"gift:{uuid}:{currency}", build)
 
 
 @router.post("/batch_gifts", response_model=BatchGiftCreateResponse, tags=["gifts"])
 async def create_batch_gifts(request: BatchGiftCreateRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Идемпотентный импорт: подарки с уже существующим steam_game_id обновляются.
+    created_product_ids - id товаров в порядке запроса, chunks - время и счетчики по пачкам.
+    """
     try:
-        created_product_ids = []
-
-        async with db.begin():
-            for gift in request.gifts:
-                product = Product(
-                    subcategory_id=7,
-                    name=gift.name,
-                    description=gift.description,
-                    image_url=f'https://cdn.cloudflare.steamstatic.com/steam/apps/{gift.steam_game_id}/library_600x900.jpg',
-                    preview_image_url=f'https://cdn.cloudflare.steamstatic.com/steam/apps/{gift.steam_game_id}/capsule_616x353.jpg',
-                    price=None
-                )
-                db.add(product)
-                await db.flush()
-
-                created_product_ids.append(product.id)
-
-                if gift.options:
-                    for opt in gift.options:
-                        product_option = ProductOption(
-                            product_id=product.id,
-                            type=opt.type,
-                            option_name=opt.option_name,
-                            title=opt.title,
-                            cols=opt.cols,
-                            items=opt.items,
-                            item=opt.item,
-                            default_value=opt.default_value,
-                            label=opt.label,
-                            tooltip=opt.tooltip,
-                            description=opt.description,
-                            child_group_name=opt.child_group_name,
-                            is_required=opt.is_required,
-                            icon=opt.icon,
-                            can_be_disabled=opt.can_be_disabled
-                        )
-                        db.add(product_option)
-
-                if gift.aliases:
-                    for alias_str in gift.aliases:
-                        alias = Alias(
-                            product_id=product.id,
-                            alias=alias_str
-                        )
-                        db.add(alias)
-
-            await db.commit()
-
-        return {"success": True, "created_product_ids": created_product_ids}
-
+        created_product_ids, chunks = await import_gifts(db, request.gifts)
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create gifts: {str(e)}")
+    finally:
+        invalidate_catalog()
+
+    return {"success": True, "created_product_ids": created_product_ids, "chunks": chunks}
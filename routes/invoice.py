@@ -1,26 +1,35 @@
 import asyncio
+import json
 import random
 import re
 import string
+import time
+import datetime as dt
 from datetime import timedelta
 from typing import List
+from uuid import uuid4
 
 from fastapi import APIRouter, Depends, status, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import update
+from sqlalchemy import update, or_, and_
 
 from routes import lava
 from models import Subcategory, User
-from models.invoice import Invoice as InvoiceModel, PaymentInvoice
+from models.invoice import Invoice as InvoiceModel
 from models.product import Product as ProductModel
 from routes.auth import register
 from schemas.invoice import *
-from database import get_db
+from database import get_db, AsyncSessionLocal
+from http_clients import get_http_client
 from schemas.user import UserCreate
-from utils import is_valid_steam_login, STEAM_LOGIN_TOKEN, STEAM_LOGIN_URL, verify_token, SECRET_DIGI, \
-    create_access_token, send_email, verify_signature
+from steam_checker import steam_login_checker, SteamLoginJob
+from invoice_reads import get_invoice_detail, get_invoice_user, forget_invoice, invoice_history_query, \
+    TERMINAL_STATUSES
+from invoice_events import invoice_events
+from utils import verify_token, SECRET_DIGI, create_access_token, enqueue_email, verify_signature
 
 import httpx
 
@@ -67,7 +76,8 @@ async def create_invoice(invoice: InvoiceCreateRequest,
             ), db)
             if new_user.token:
                 reset_token = new_user.token
-                await send_email(
+                enqueue_email(
+                    db,
                     recipient_email=invoice.delivery_email,
                     template_type="activate_profile",
                     subject="Активация профиля",
@@ -85,85 +95,97 @@ async def create_invoice(invoice: InvoiceCreateRequest,
     )
 
     if invoice.payment_system == 'lava':
-        lava_resp = lava.create_payment(float(invoice.amount), db_invoice.uuid)
+        try:
+            lava_resp = await lava.create_payment(float(invoice.amount), db_invoice.uuid)
+        except (httpx.HTTPError, ValueError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Error communicating with LAVA: {str(e)}"
+            )
+        if lava_resp.data is None:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"LAVA did not create the invoice: {lava_resp.error}"
+            )
         return {'redirect_url': lava_resp.data.url}
     elif invoice.payment_system == 'profitable':
-        async with httpx.AsyncClient(verify=False) as client:
-            try:
-                payment_url = "https://pay.gamemoneta.com/pay/init_payment_gamemoneta"
-                response = await client.post(payment_url, data=redirect_data.model_dump())
+        try:
+            payment_url = "https://pay.gamemoneta.com/pay/init_payment_gamemoneta"
+            response = await get_http_client("payment").post(payment_url, data=redirect_data.model_dump())
 
-                response.raise_for_status()
+            response.raise_for_status()
 
-                response_data = response.json()
-                encoded_id = response_data.get('uuid')
-                if not encoded_id:
-                    raise HTTPException(
-                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                        detail="Failed to retrieve UUID from payment service."
-                    )
+            response_data = response.json()
+            encoded_id = response_data.get('uuid')
+            if not encoded_id:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to retrieve UUID from payment service."
+                )
 
-                redirect_url = f"https://pay.gamemoneta.com/?uuid={encoded_id}"
+            redirect_url = f"https://pay.gamemoneta.com/?uuid={encoded_id}"
 
-                return {'redirect_url': redirect_url}
+            return {'redirect_url': redirect_url}
+
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=e.response.status_code,
+                detail=f"Error communicating with payment service: {e.response.text}"
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"An unexpected error occurred: {str(e)}")
 
-            except httpx.HTTPStatusError as e:
-                raise HTTPException(
-                    status_code=e.response.status_code,
-                    detail=f"Error communicating with payment service: {e.response.text}"
-                )
-            except Exception as e:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"An unexpected error occurred: {str(e)}")
 
+STEAM_CHECK_REQUEST_WAIT = 60
+SSE_HEARTBEAT_SECONDS = 15
+# После этого поток закрывается, клиент переподключается (EventSource делает это сам)
+INVOICE_STREAM_MAX_SECONDS = 1800
 
-MAX_RETRIES = 20
-INITIAL_RETRY_DELAY = 1
-BACKOFF_FACTOR = 2
 
+def steam_job_response(job: SteamLoginJob) -> SteamLoginCheckJobResponse:
+    return SteamLoginCheckJobResponse(job_id=job.id, status=job.status, success=bool(job.success), error=job.error)
 
-@router.get("/check_login", tags=["invoices"])
+
+@router.get("/check_login", response_model=SteamLoginCheckJobResponse, tags=["invoices"])
 async def check_login(login: str):
-    login_is_valid = is_valid_steam_login(login)
-    if login_is_valid:
-        async with httpx.AsyncClient(verify=False) as client:
-            check = await client.get(
-                f'{STEAM_LOGIN_URL}check_steam_login?api_key={STEAM_LOGIN_TOKEN}&steam_login={login}&steam_value=26')
-            check.raise_for_status()
-
-            check = check.json()
-            if not check["success"]:
-                return {"success": False, "error": "Проверьте правильность логина"}
-
-            trans_id = check["request_id"]
-
-            retry_delay = INITIAL_RETRY_DELAY
-            for attempt in range(MAX_RETRIES):
-                trans_response = await client.get(
-                    f"{STEAM_LOGIN_URL}get_steam_response",
-                    params={"api_key": STEAM_LOGIN_TOKEN, "trans_id": trans_id}
-                )
-                trans_response.raise_for_status()
-                trans_data = trans_response.json()
-
-                trans_status = trans_data.get("status")
-                if trans_status != "process":
-                    break
-
-                await asyncio.sleep(retry_delay)
-                retry_delay *= BACKOFF_FACTOR
-
-            if trans_status == "ready" and trans_data["response"]["success"]:
-                return {"success": True}
-            return {
-                "success": False,
-                "error": (
-                    "Нет возможности пополнить данный аккаунт, если вы уверены, "
-                    "что регион вашего аккаунта верный - повторите попытку позже."
-                )
-            }
-    return {"success": False, "error": 'Проверьте правильность логина'}
+    """
+    Ждет результат проверки не дольше STEAM_CHECK_REQUEST_WAIT секунд. Если проверка еще идет,
+    возвращает status="process" и job_id для /check_login/jobs/{job_id} или /check_login/stream.
+    """
+    job = await steam_login_checker.submit(login)
+    await steam_login_checker.wait(job, timeout=STEAM_CHECK_REQUEST_WAIT)
+    return steam_job_response(job)
+
+
+@router.post("/check_login/jobs", response_model=SteamLoginCheckJobResponse, tags=["invoices"])
+async def submit_login_check(login: str):
+    return steam_job_response(await steam_login_checker.submit(login))
+
+
+@router.get("/check_login/jobs/{job_id}", response_model=SteamLoginCheckJobResponse, tags=["invoices"])
+async def get_login_check(job_id: str):
+    job = steam_login_checker.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Login check not found")
+    return steam_job_response(job)
+
+
+@router.get("/check_login/stream", tags=["invoices"])
+async def stream_login_check(login: str):
+    """Server-sent events: событие status сразу и событие result, когда проверка завершится."""
+    job = await steam_login_checker.submit(login)
+
+    async def events():
+        yield f"event: status\ndata: {steam_job_response(job).model_dump_json()}\n\n"
+        while not job.done.is_set():
+            await steam_login_checker.wait(job, timeout=SSE_HEARTBEAT_SECONDS)
+            if not job.done.is_set():
+                yield ": keep-alive\n\n"
+        yield f"event: result\ndata: {steam_job_response(job).model_dump_json()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @router.get("/check_steam_link", tags=["invoices"])
@@ -181,28 +203,67 @@ async def get_invoice(uuid: str, authorization: Optional[str] = Header(None), db
     except AssertionError:
         raise HTTPException(status_code=400, detail="Invalid UUID format")
 
-    db_invoice = (await db.execute(select(InvoiceModel).where(InvoiceModel.uuid == uuid).options(
-        selectinload(InvoiceModel.product)
-        .selectinload(ProductModel.subcategory)
-        .selectinload(Subcategory.category),
-        selectinload(InvoiceModel.user)
-    ))).scalar_one_or_none()
+    invoice = await get_invoice_detail(db, uuid)
 
-    if not db_invoice:
+    if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    payment_invoice = (await db.execute(
-        select(PaymentInvoice).where(PaymentInvoice.gamemoneta_invoice_uuid == uuid))).scalar_one_or_none()
-
     if authorization:
         try:
             payload = verify_token(authorization)
-            if int(payload['sub']) == db_invoice.user_id:
-                return InvoiceAuthedResponse(data=db_invoice, payment_invoice=payment_invoice, success=True)
+            if int(payload['sub']) == invoice.user_id:
+                user = await get_invoice_user(db, invoice)
+                return InvoiceAuthedResponse(data=invoice.authed(user), payment_invoice=invoice.payment_invoice,
+                                             success=True)
         except HTTPException as e:
             pass
 
-    return InvoiceResponse(data=db_invoice, payment_invoice=payment_invoice, success=True)
+    return InvoiceResponse(data=invoice.invoice, payment_invoice=invoice.payment_invoice, success=True)
+
+
+@router.get("/stream/{uuid}", tags=["invoices"])
+async def stream_invoice_status(uuid: str):
+    """
+    Server-sent events вместо опроса /get/{uuid}: событие status с текущим статусом сразу,
+    затем по событию на каждое изменение статуса или ответ платежной системы.
+    Поток закрывается, когда счет переходит в конечный статус.
+    """
+    try:
+        assert len(uuid) == 36 and uuid.count('-') == 4
+    except AssertionError:
+        raise HTTPException(status_code=400, detail="Invalid UUID format")
+
+    async def events():
+        # Подписка до чтения статуса, чтобы не потерять изменение между ними
+        async with invoice_events.subscribe(uuid) as queue:
+            async with AsyncSessionLocal() as db:
+                invoice = await get_invoice_detail(db, uuid)
+            if invoice is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Invoice not found'})}\n\n"
+                return
+
+            current = InvoiceStatusEvent(
+                uuid=uuid,
+                status=invoice.invoice.status,
+                payment_status=invoice.payment_invoice.status.value if invoice.payment_invoice else None,
+            )
+            yield f"event: status\ndata: {current.model_dump_json()}\n\n"
+            if invoice.is_terminal:
+                return
+
+            deadline = time.monotonic() + INVOICE_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+                if event["status"] in TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @router.get("/", response_model=InvoiceListResponse, status_code=status.HTTP_200_OK, tags=["orders", "invoices"])
@@ -217,18 +278,9 @@ async def get_all_orders(authorization: Optional[str] = Header(None),
             payload = verify_token(authorization)
             user_id = int(payload["sub"])
 
-            query = select(InvoiceModel).where(InvoiceModel.user_id == user_id).options(
-                selectinload(InvoiceModel.product)
-                .selectinload(ProductModel.subcategory)
-                .selectinload(Subcategory.category),
-                selectinload(InvoiceModel.user)
-            )
-            if cursor:
-                query = query.where(InvoiceModel.id < cursor)
-            if status:
-                query = query.where(InvoiceModel.status.in_(status))
-
-            invoices = (await db.execute(query.order_by(-InvoiceModel.id).limit(limit))).scalars().all()
+            query = invoice_history_query(user_id, limit, cursor=cursor,
+                                          statuses=[item.value for item in status] if status else None)
+            invoices = (await db.execute(query)).unique().scalars().all()
 
             return InvoiceListResponse(data=list(invoices), success=True)
         except HTTPException as e:
@@ -264,7 +316,8 @@ async def change_invoice_status(
     db_invoice.status = invoice.status
     if invoice.status == InvoiceStatus.paid:
         db_invoice.order_confirm = True
-        email_created = await send_email(
+        enqueue_email(
+            db,
             recipient_email=db_invoice.delivery_email,
             template_type="transaction",
             subject="Успешная покупка",
@@ -272,13 +325,18 @@ async def change_invoice_status(
         )
 
     await db.commit()
+    forget_invoice(invoice.uuid)
+    await invoice_events.publish(invoice.uuid, status=invoice.status)
     await db.refresh(db_invoice)
 
     return InvoiceChangeStatusResponse(success=True, status=invoice.status)
 
 
 @router.get("/get_pending_transactions", response_model=InvoicePendingResponse, tags=["invoices"])
-async def get_pending_transactions(secret_key: str, db: AsyncSession = Depends(get_db)):
+async def get_pending_transactions(secret_key: str,
+                                   limit: Optional[int] = Query(None, description="Max invoices to fetch", gt=0,
+                                                                le=1000),
+                                   db: AsyncSession = Depends(get_db)):
     if secret_key != SECRET_DIGI:
         return {
             'error': f'Invalid key {secret_key}',
@@ -288,21 +346,26 @@ async def get_pending_transactions(secret_key: str, db: AsyncSession = Depends(g
         selectinload(InvoiceModel.product)
         .selectinload(ProductModel.subcategory)
         .selectinload(Subcategory.category),
-        selectinload(InvoiceModel.user))
+        selectinload(InvoiceModel.user)).order_by(InvoiceModel.id).with_for_update(skip_locked=True)
+    if limit:
+        query = query.limit(limit)
 
     result = list((await db.execute(query)).scalars().all())
 
     if not result:
+        await db.rollback()
         return InvoicePendingResponse(error='No transactions found with status "paid".')
 
     try:
+        # Переводим в process только те счета, которые вернем, а не все, что стали paid после SELECT
         update_query = (
             update(InvoiceModel)
-            .where(InvoiceModel.status == 'paid')
+            .where(InvoiceModel.uuid.in_([invoice.uuid for invoice in result]), InvoiceModel.status == 'paid')
             .values(status='process')
         )
         await db.execute(update_query)
         await db.commit()
+        await invoice_events.publish(*(invoice.uuid for invoice in result), status=InvoiceStatus.process)
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -313,26 +376,112 @@ async def get_pending_transactions(secret_key: str, db: AsyncSession = Depends(g
     return InvoicePendingResponse(invoices=result)
 
 
+CLAIM_LEASE_SECONDS = 300
+MAX_CLAIM_LEASE_SECONDS = 3600
+
+
+@router.post("/claim_pending", response_model=InvoiceClaimResponse, tags=["invoices"])
+async def claim_pending_transactions(secret_key: str,
+                                     limit: int = Query(50, description="Max invoices to claim", gt=0, le=500),
+                                     lease_seconds: int = Query(CLAIM_LEASE_SECONDS, gt=0,
+                                                                le=MAX_CLAIM_LEASE_SECONDS),
+                                     db: AsyncSession = Depends(get_db)):
+    """
+    Забирает пачку оплаченных счетов для обработчика выдачи.
+
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько обработчиков
+    разбирают очередь параллельно, не получая одни и те же счета. Счета, не подтвержденные через
+    /ack до окончания аренды, снова становятся доступными для захвата.
+    """
+    if secret_key != SECRET_DIGI:
+        return InvoiceClaimResponse(error=f'Invalid key {secret_key}')
+
+    now = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    claimable = or_(
+        InvoiceModel.status == "paid",
+        and_(InvoiceModel.status == "process",
+             InvoiceModel.claim_token.is_not(None),
+             InvoiceModel.claim_expires_at < now),
+    )
+
+    try:
+        uuids = list((await db.execute(
+            select(InvoiceModel.uuid).where(claimable).order_by(InvoiceModel.id).limit(limit)
+            .with_for_update(skip_locked=True)
+        )).scalars().all())
+
+        if not uuids:
+            await db.rollback()
+            return InvoiceClaimResponse(error='No transactions found with status "paid".')
+
+        claim_token = str(uuid4())
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+        await db.execute(
+            update(InvoiceModel)
+            .where(InvoiceModel.uuid.in_(uuids))
+            .values(status='process', claim_token=claim_token, claim_expires_at=lease_expires_at)
+        )
+
+        invoices = (await db.execute(
+            select(InvoiceModel).where(InvoiceModel.uuid.in_(uuids)).order_by(InvoiceModel.id).options(
+                selectinload(InvoiceModel.product)
+                .selectinload(ProductModel.subcategory)
+                .selectinload(Subcategory.category))
+        )).scalars().all()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to claim transactions: {str(e)}"
+        )
+
+    await invoice_events.publish(*uuids, status=InvoiceStatus.process)
+    return InvoiceClaimResponse(claim_token=claim_token, lease_expires_at=lease_expires_at, invoices=list(invoices))
+
+
+@router.post("/ack", response_model=InvoiceAckResponse, tags=["invoices"])
+async def ack_claimed_transactions(body: InvoiceAckRequest, secret_key: str, db: AsyncSession = Depends(get_db)):
+    """
+    Подтверждает обработку захваченных счетов и снимает с них аренду.
+
+    Повторный ack с тем же токеном безопасен: уже подтвержденные счета попадут в rejected.
+    """
+    if secret_key != SECRET_DIGI:
+        return InvoiceAckResponse(error=f'Invalid key {secret_key}')
+
+    acked = list((await db.execute(
+        select(InvoiceModel.uuid)
+        .where(InvoiceModel.uuid.in_(body.uuids),
+               InvoiceModel.claim_token == body.claim_token,
+               InvoiceModel.status == 'process')
+        .with_for_update()
+    )).scalars().all())
+
+    if acked:
+        await db.execute(
+            update(InvoiceModel)
+            .where(InvoiceModel.uuid.in_(acked))
+            .values(status=body.status.value, claim_token=None, claim_expires_at=None)
+        )
+    await db.commit()
+    await invoice_events.publish(*acked, status=body.status)
+
+    acked_set = set(acked)
+    return InvoiceAckResponse(acked=acked, rejected=[uuid for uuid in body.uuids if uuid not in acked_set])
+
+
 @router.get("/get_payment_transaction_id", response_model=InvoicePaymentIdResponse, tags=["invoices"])
 async def get_payment_transaction_id(uuid: str, secret_key: str, db: AsyncSession = Depends(get_db)):
     if secret_key != SECRET_DIGI:
         return InvoicePaymentIdResponse(error="Invalid secret key}")
 
-    invoice = (await db.execute(
-        select(InvoiceModel).where(InvoiceModel.uuid == uuid).options(
-            selectinload(InvoiceModel.product)
-            .selectinload(ProductModel.subcategory)
-            .selectinload(Subcategory.category),
-            selectinload(InvoiceModel.user))
-    )).scalar_one_or_none()
+    invoice = await get_invoice_detail(db, uuid)
 
     if not invoice:
         return InvoicePaymentIdResponse(error="Invoice not found.")
 
-    payment_invoice = (await db.execute(
-        select(PaymentInvoice).where(PaymentInvoice.gamemoneta_invoice_uuid == uuid))).scalar_one_or_none()
-
-    if not payment_invoice:
+    if not invoice.payment_invoice:
         return InvoicePaymentIdResponse(error="Payment invoice not found.")
 
-    return InvoicePaymentIdResponse(invoice=invoice, payment_invoice=payment_invoice)
+    return InvoicePaymentIdResponse(invoice=invoice.invoice, payment_invoice=invoice.payment_invoice)
@@ -1,13 +1,19 @@
+import asyncio
+import functools
 import hashlib
 import hmac
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict
 
-import requests
+import httpx
 import json
 from fastapi import APIRouter, Depends, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from cache import TTLCache
 from database import get_db
+from http_clients import get_http_client
+from invoice_events import invoice_events
 from models import LavaWebhook
 
 from schemas.lava import LavaInvoiceCreateResponse, LavaWebhookRequest
@@ -15,20 +21,70 @@ from utils import API_LAVA_CREATE, API_LAVA_TOKEN, LAVA_SUCCESS_URL, LAVA_SHOP_I
 
 router = APIRouter()
 
+LAVA_INVOICE_EXPIRE = 60  # минуты
+LAVA_MAX_ATTEMPTS = 3
+LAVA_RETRY_DELAY = 0.5
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
-def create_payment(amount: float, order_id: str) -> LavaInvoiceCreateResponse:
+# Созданные счета LAVA по uuid заказа: повторный запрос на тот же заказ не создает новый счет
+_created_payments = TTLCache(maxsize=4096, ttl=LAVA_INVOICE_EXPIRE * 60)
+_pending_payments: Dict[str, asyncio.Task] = {}
+
+
+async def _post_payment(payment_data: dict) -> LavaInvoiceCreateResponse:
+    # Подписываем и отправляем одни и те же байты: сериализация httpx(json=...) отличается от json.dumps
+    json_str = json.dumps(payment_data).encode()
+    sign = hmac.new(bytes(API_LAVA_TOKEN, 'UTF-8'), json_str, hashlib.sha256).hexdigest()
+    headers = {
+        'Signature': sign,
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+
+    for attempt in range(1, LAVA_MAX_ATTEMPTS + 1):
+        try:
+            response = await get_http_client("lava").post(API_LAVA_CREATE, content=json_str, headers=headers)
+            if response.status_code not in RETRYABLE_STATUSES or attempt == LAVA_MAX_ATTEMPTS:
+                return LavaInvoiceCreateResponse.model_validate(response.json())
+        except httpx.TransportError:
+            if attempt == LAVA_MAX_ATTEMPTS:
+                raise
+
+        await asyncio.sleep(LAVA_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def _payment_finished(order_id: str, task: asyncio.Task) -> None:
+    _pending_payments.pop(order_id, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    if task.result().data is not None:
+        _created_payments.set(order_id, task.result())
+
+
+async def create_payment(amount: float, order_id: str) -> LavaInvoiceCreateResponse:
     """
     Функция для создания платежа через LAVA.
 
+    Запросы с одним order_id идемпотентны: параллельные вызовы ждут один запрос к LAVA,
+    а успешно созданный счет переиспользуется, пока он не истек.
+
     :param amount: Сумма платежа (например, 1500.00)
     :param order_id: Уникальный ID заказа в invoices
     :return: Ответ от API в формате JSON
     """
+    created = _created_payments.get(order_id)
+    if created is not None:
+        return created
+
+    pending = _pending_payments.get(order_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
     payment_data = {
         "comment": f"Оплата товара {order_id}",
         "customFields": None,
         "excludeService": [],
-        "expire": 60,
+        "expire": LAVA_INVOICE_EXPIRE,
         "failUrl": LAVA_SUCCESS_URL,
         "hookUrl": None,
         "includeService": [],
@@ -40,19 +96,12 @@ def create_payment(amount: float, order_id: str) -> LavaInvoiceCreateResponse:
 
     payment_data = dict(sorted(payment_data.items(), key=lambda x: x[0]))
 
-    json_str = json.dumps(payment_data).encode()
-    sign = hmac.new(bytes(API_LAVA_TOKEN, 'UTF-8'), json_str, hashlib.sha256).hexdigest()
-
-    response = requests.post(
-        API_LAVA_CREATE,
-        json=payment_data,
-        headers={
-            'Signature': sign,
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-    )
-    return LavaInvoiceCreateResponse.model_validate(response.json())
+    # Запрос к LAVA - отдельная задача: если вызвавший запрос отменят (клиент отключился), счет
+    # все равно создастся, и параллельные вызовы с этим заказом получат его, а не CancelledError
+    task = asyncio.create_task(_post_payment(payment_data), name=f"lava-payment-{order_id}")
+    _pending_payments[order_id] = task
+    task.add_done_callback(functools.partial(_payment_finished, order_id))
+    return await asyncio.shield(task)
 
 
 @router.post("/webhook", status_code=status.HTTP_201_CREATED, tags=["lava"])
@@ -77,5 +126,6 @@ async def lava_webhook(webhook_data: LavaWebhookRequest, db: AsyncSession = Depe
     db.add(db_webhook)
     await db.commit()
     await db.refresh(db_webhook)
+    await invoice_events.publish(webhook_data.order_id, payment_status=webhook_data.status)
 
     return {"status": "success", "message": "Webhook received and stored"}
@@ -5,7 +5,7 @@ from sqlalchemy.future import select
 from database import get_db
 from models.user import User, OAuthProfile
 from schemas.oauth import TelegramCallbackSchema, TelegramCallbackConnectSchema
-from utils import create_access_token, find_user_by_token
+from utils import create_access_token, find_user_by_token, invalidate_user
 import os
 import hashlib
 import hmac
@@ -75,7 +75,8 @@ async def telegram_callback(data: TelegramCallbackSchema, db: AsyncSession = Dep
     oauth_user = (await db.execute(select(OAuthProfile).where(OAuthProfile.oauth_id == data.id))).scalar_one_or_none()
 
     if oauth_user:
-        user = oauth_user.user
+        # Ленивая загрузка oauth_user.user в async-сессии невозможна, а нужен только id
+        user_id = oauth_user.user_id
     else:
         user = User(name=f'{data.first_name} {data.last_name}', is_active=True)
         db.add(user)
@@ -92,8 +93,9 @@ async def telegram_callback(data: TelegramCallbackSchema, db: AsyncSession = Dep
         db.add(new_profile)
         await db.commit()
         await db.refresh(new_profile)
+        user_id = user.id
 
-    access_token = create_access_token({"sub": str(user.id)})
+    access_token = create_access_token({"sub": str(user_id)})
 
     return {"token": access_token}
 
@@ -129,6 +131,7 @@ async def telegram_callback_connect(data: TelegramCallbackConnectSchema, db: Asy
         real_user.photo = data.photo_url
 
     await db.commit()
+    await invalidate_user(real_user.id)
     await db.refresh(oauth_user)
 
     return {
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
 from sqlalchemy.future import select
 from models.order import Order as OrderModel
 from models.order_item import OrderItem as OrderItemModel
@@ -8,42 +9,55 @@ from models.product import Product as ProductModel
 from schemas.order import Order, OrderCreate, OrderListResponse, OrderItemBase
 from database import get_db
 from datetime import datetime
+from decimal import Decimal
 
 router = APIRouter()
 
 
 @router.post("/", response_model=Order, status_code=status.HTTP_201_CREATED, tags=["orders"])
 async def create_order(order: OrderCreate, user_id: int, db: AsyncSession = Depends(get_db)):
-    db_user = (await db.execute(select(UserModel).where(UserModel.id == user_id))).scalar_one_or_none()
+    """
+    Цены всех товаров заказа загружаются одним IN-запросом, заказ и позиции
+    записываются в одной транзакции (позиции - одним многострочным INSERT).
+    """
+    db_user = (await db.execute(select(UserModel.id).where(UserModel.id == user_id))).scalar_one_or_none()
 
     if not db_user:
         raise HTTPException(status_code=404, detail="User  not found")
 
-    total_price = 0.0
-    order_items = []
+    product_ids = {item.product_id for item in order.items}
+    prices = dict((await db.execute(
+        select(ProductModel.id, ProductModel.price).where(ProductModel.id.in_(product_ids))
+    )).all()) if product_ids else {}
 
+    total_price = Decimal(0)
+    items = []
     for item in order.items:
-        db_product = db.get(ProductModel, item.product_id)
-        if not db_product:
+        if item.product_id not in prices:
             raise HTTPException(status_code=404, detail=f"Product with id {item.product_id} not found")
+        item_price = prices[item.product_id]
+        if item_price is None:
+            raise HTTPException(status_code=400, detail=f"Product with id {item.product_id} has no price")
 
-        item_price = db_product.price
-        total_price += item_price * item.quantity
-
-        order_item = OrderItemModel(order_id=0, product_id=item.product_id, quantity=item.quantity, price=item_price)
-        order_items.append(order_item)
+        total_price += Decimal(item_price) * item.quantity
+        items.append({"product_id": item.product_id, "quantity": item.quantity, "price": item_price})
 
     new_order = OrderModel(user_id=user_id, order_date=datetime.now(), status="Pending", total_price=total_price)
     db.add(new_order)
-    await db.commit()
-    await db.refresh(new_order)
-
-    for item in order_items:
-        item.order_id = new_order.id
-        db.add(item)
+    await db.flush()
 
+    if items:
+        await db.execute(insert(OrderItemModel), [{**item, "order_id": new_order.id} for item in items])
     await db.commit()
-    return new_order
+
+    return Order(
+        id=new_order.id,
+        user_id=new_order.user_id,
+        order_date=new_order.order_date,
+        status=new_order.status,
+        total_price=new_order.total_price,
+        items=[OrderItemBase(**item) for item in items],
+    )
 
 
 @router.get("/{user_id}", response_model=OrderListResponse, status_code=status.HTTP_200_OK, tags=["orders"])
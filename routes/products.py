@@ -1,6 +1,8 @@
-from typing import List
+import json
+from typing import List, Optional, Type
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload, selectinload
@@ -8,12 +10,112 @@ from sqlalchemy.orm import joinedload, selectinload
 from models.product import Product as ProductModel, ProductOption as ProductOptionModel
 from models.subcategory import Subcategory as SubcategoryModel
 from schemas.product import Product, ProductUpdate, ProductListGetAllResponse, ProductGetByIdResponse, ProductFull, \
-    ProductCreate, ProductOptionBase
+    ProductCreate, ProductOptionBase, ProductCard, ProductCardListResponse, CurrencyCode
 from database import get_db
-from utils import currencies
+from currency_rates import currency_rates
+from cache import catalog_cache, invalidate_catalog
+from pricing import localize_products
 
 router = APIRouter()
 
+PRODUCT_FIELDS = set(ProductCard.model_fields)
+
+
+def parse_product_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Разбирает параметр fields= в список колонок для облегченной выборки.
+
+    Returns:
+        Optional[List[str]]: Колонки (id всегда первой) или None, если нужна полная выдача.
+
+    Raises:
+        HTTPException.
+    """
+    if not fields:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - PRODUCT_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    return ["id", *sorted(requested - {"id"})]
+
+
+def localized_json(response: BaseModel, items_key: str, currency: Optional[CurrencyCode] = None, **dump) -> bytes:
+    """
+    JSON ответа. Если задана currency, цены товаров (и цены в опциях) в нем уже
+    пересчитаны из рублей и округлены, а в ответ добавляется поле currency.
+    """
+    if currency is None:
+        return response.model_dump_json(**dump).encode()
+
+    payload = response.model_dump(mode="json", **dump)
+    items = payload[items_key]
+    localize_products(items if isinstance(items, list) else [items], currency)
+    payload["currency"] = currency
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def filter_product_query(query, cursor: Optional[int] = None, limit: Optional[int] = None,
+                         subcategory_id: Optional[int] = None, category_id: Optional[int] = None,
+                         min_price: Optional[float] = None, max_price: Optional[float] = None):
+    if subcategory_id is not None:
+        query = query.where(ProductModel.subcategory_id == subcategory_id)
+    if category_id is not None:
+        query = query.where(ProductModel.subcategory_id.in_(
+            select(SubcategoryModel.id).where(SubcategoryModel.category_id == category_id)
+        ))
+    if min_price is not None:
+        query = query.where(ProductModel.price >= min_price)
+    if max_price is not None:
+        query = query.where(ProductModel.price <= max_price)
+    if cursor is not None:
+        query = query.where(ProductModel.id > cursor)
+
+    query = query.order_by(ProductModel.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+async def build_product_list(db: AsyncSession, list_key: str, full_schema: Type[BaseModel],
+                             card_schema: Type[BaseModel], columns: Optional[List[str]], query_filter=None,
+                             limit: Optional[int] = None, currency: Optional[CurrencyCode] = None,
+                             **filters) -> bytes:
+    """
+    Сериализованный список товаров с keyset-пагинацией по id.
+
+    Если заданы columns, выбираются только эти колонки без связей и отдаются облегченные карточки.
+    """
+    if columns:
+        query = select(*(getattr(ProductModel, column) for column in columns))
+    else:
+        query = select(ProductModel).options(
+            joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
+            selectinload(ProductModel.aliases),
+            selectinload(ProductModel.options),
+        )
+    if query_filter is not None:
+        query = query.where(query_filter)
+
+    result = await db.execute(filter_product_query(query, limit=limit, **filters))
+
+    if columns:
+        items = [ProductCard.model_validate(dict(row._mapping)) for row in result]
+    else:
+        items = result.unique().scalars().all()
+    next_cursor = items[-1].id if limit and len(items) == limit else None
+
+    if columns:
+        response = card_schema(**{list_key: items, 'success': len(items) > 0, 'next_cursor': next_cursor})
+        return localized_json(response, list_key, currency, exclude_unset=True)
+
+    response = full_schema.model_validate(
+        {list_key: items, 'success': len(items) > 0, 'next_cursor': next_cursor}, from_attributes=True
+    )
+    return localized_json(response, list_key, currency)
+
 
 @router.post("/", response_model=ProductFull, status_code=status.HTTP_201_CREATED, tags=["products"])
 async def create_product(product_data: ProductCreate, db: AsyncSession = Depends(get_db)):
@@ -50,6 +152,7 @@ async def create_product(product_data: ProductCreate, db: AsyncSession = Depends
                 db.add(db_option)
 
         await db.commit()
+        invalidate_catalog()
         await db.refresh(db_product, attribute_names=["options"])
 
         return db_product
@@ -90,6 +193,7 @@ async def update_product_options(
                 db.add(db_option)
 
         await db.commit()
+        invalidate_catalog()
         await db.refresh(db_product, attribute_names=["options"])
 
         return db_product
@@ -111,6 +215,7 @@ async def update_product(uid: int, product: ProductUpdate, db: AsyncSession = De
         setattr(db_product, key, value)
 
     await db.commit()
+    invalidate_catalog()
     await db.refresh(db_product)
     return db_product
 
@@ -123,44 +228,62 @@ async def delete_product(uid: int, db: AsyncSession = Depends(get_db)):
 
     await db.delete(db_product)
     await db.commit()
+    invalidate_catalog()
     return
 
 
 @router.get("/", response_model=ProductListGetAllResponse, tags=["products"])
-async def get_all_products(db: AsyncSession = Depends(get_db)):
-    products = (
-        await db.execute(
-            select(ProductModel)
-            .options(
-                joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
-                selectinload(ProductModel.aliases),
-                selectinload(ProductModel.options),
-            )
-        )
-    ).unique().scalars().all()
+async def get_all_products(
+        request: Request,
+        cursor: Optional[int] = Query(None, description="The ID of the last fetched product"),
+        limit: Optional[int] = Query(None, description="Number of products to fetch", gt=0, le=500),
+        subcategory_id: Optional[int] = Query(None),
+        category_id: Optional[int] = Query(None),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+        fields: Optional[str] = Query(None, description="Comma-separated fields, e.g. id,name,price,preview_image_url"),
+        currency: Optional[CurrencyCode] = Query(None, description="Return prices converted to this currency"),
+        db: AsyncSession = Depends(get_db)
+):
+    columns = parse_product_fields(fields)
+    filters = dict(cursor=cursor, limit=limit, subcategory_id=subcategory_id, category_id=category_id,
+                   min_price=min_price, max_price=max_price)
 
-    return {
-        'products': list(products),
-        'success': len(list(products)) > 0
-    }
+    async def build() -> bytes:
+        return await build_product_list(db, 'products', ProductListGetAllResponse, ProductCardListResponse,
+                                        columns, currency=currency, **filters)
+
+    cache_key = f"products:{sorted(filters.items())}:{columns}:{currency}"
+    return await catalog_cache.response(request, cache_key, build)
 
 
 @router.get("/{uuid}", response_model=ProductGetByIdResponse, tags=["products"])
-async def get_product_by_id(uuid: int, db: AsyncSession = Depends(get_db)):
-    db_product = (
-        await db.execute(
-            select(ProductModel)
-            .where(ProductModel.id == uuid)
-            .options(
-                joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
-                joinedload(ProductModel.options),
-                joinedload(ProductModel.delivery_inputs),
-                joinedload(ProductModel.faq),
-                joinedload(ProductModel.aliases),
+async def get_product_by_id(
+        uuid: int,
+        request: Request,
+        currency: Optional[CurrencyCode] = Query(None, description="Return prices converted to this currency"),
+        db: AsyncSession = Depends(get_db)
+):
+    async def build() -> bytes:
+        db_product = (
+            await db.execute(
+                select(ProductModel)
+                .where(ProductModel.id == uuid)
+                .options(
+                    joinedload(ProductModel.subcategory).joinedload(SubcategoryModel.category),
+                    joinedload(ProductModel.options),
+                    joinedload(ProductModel.delivery_inputs),
+                    joinedload(ProductModel.faq),
+                    joinedload(ProductModel.aliases),
+                )
             )
+        ).unique().scalar_one_or_none()
+        if not db_product or (db_product.subcategory and db_product.subcategory.category.id == 2):
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        response = ProductGetByIdResponse.model_validate(
+            {'data': db_product, 'success': True, 'currencies': currency_rates.snapshot.as_dict()}, from_attributes=True
         )
-    ).unique().scalar_one_or_none()
-    if not db_product or (db_product.subcategory and db_product.subcategory.category.id == 2):
-        raise HTTPException(status_code=404, detail="Product not found")
+        return localized_json(response, 'data', currency)
 
-    return {'data': db_product, 'success': True, 'currencies': currencies}
+    return await catalog_cache.response(request, f"product:{uuid}:{currency}", build)
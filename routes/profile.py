@@ -1,7 +1,7 @@
 from datetime import timedelta
 from typing import Optional
 
-from fastapi import Depends, APIRouter, HTTPException, status, Header
+from fastapi import Depends, APIRouter, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
@@ -10,36 +10,15 @@ from models.user import User, OAuthProfile
 
 from schemas.user import UserDataResponse, UserChangeData, ChangeEmailData, UserConnectEmailLogin, \
     UserConnectEmailLoginResponse
-from utils import oauth2_scheme, find_user_by_token, pwd_context, send_email, create_access_token, verify_token
-import jwt
+from utils import oauth2_scheme, find_user_by_token, password_hasher, enqueue_email, create_access_token, verify_token, \
+    invalidate_user, get_current_principal, get_current_user_id, load_profile
 
 router = APIRouter()
 
 
 @router.get("/", response_model=UserDataResponse, tags=["profile"])
-async def get_user_profile(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    try:
-        user = await find_user_by_token(token, db)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid token")
-
-    telegram_profile = (await db.execute(select(OAuthProfile).where(
-        OAuthProfile.user_id == user.id and OAuthProfile.provider == "telegram"))).scalar_one_or_none()
-
-    return {
-        "data": {
-            "id": user.id,
-            "email": user.email,
-            "photo": user.photo,
-            "name": user.name,
-            "gender": user.gender,
-            "is_active": user.is_active,
-            "bonuses": user.bonuses,
-            "telegramId": int(telegram_profile.oauth_id) if telegram_profile else None
-        }
-    }
+async def get_user_profile(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    return {"data": await load_profile(user_id, db)}
 
 
 @router.post("/info", response_model=UserDataResponse, tags=["profile"])
@@ -51,6 +30,7 @@ async def change_info(user_data: UserChangeData, token: str = Depends(oauth2_sch
     user.name = user_data.name
 
     await db.commit()
+    await invalidate_user(user.id)
     await db.refresh(user)
 
     return {
@@ -73,7 +53,7 @@ async def connect_email(user_data: UserConnectEmailLogin, db: AsyncSession = Dep
             'message': 'Вы не авторизованы, пожалуйста, обновите страницу',
             'success': False,
         }
-    current_user = await find_user_by_token(user_data.token, db)
+    current_user = await get_current_principal(user_data.token, db)
 
     oauth_profile = (
         await db.execute(select(OAuthProfile).where(OAuthProfile.user_id == current_user.id))).scalar_one_or_none()
@@ -84,7 +64,7 @@ async def connect_email(user_data: UserConnectEmailLogin, db: AsyncSession = Dep
             'success': False,
         }
 
-    if current_user.email or current_user.hashed_password:
+    if current_user.email or current_user.has_password:
         return {
             'message': "К текущему аккаунту уже привязана почта",
             'success': False,
@@ -98,19 +78,21 @@ async def connect_email(user_data: UserConnectEmailLogin, db: AsyncSession = Dep
             expires_delta=timedelta(minutes=30)
         )
 
-        await send_email(
+        enqueue_email(
+            db,
             recipient_email=user_data.email,
             template_type="email_reset",
             subject="Смена почты",
             email_data={"reset_token": reset_token}
         )
+        await db.commit()
 
         return {
             'message': f"Подтвердите смену почты в письме",
             'success': True,
         }
 
-    elif not pwd_context.verify(user_data.password, existing_user.hashed_password):
+    elif not await password_hasher.verify(user_data.password, existing_user.hashed_password):
         return {
             'message': "Неправильный пароль, попробуйте снова",
             'success': False,
@@ -118,6 +100,8 @@ async def connect_email(user_data: UserConnectEmailLogin, db: AsyncSession = Dep
 
     oauth_profile.user_id = existing_user.id
     await db.commit()
+    await invalidate_user(current_user.id)
+    await invalidate_user(existing_user.id)
     await db.refresh(oauth_profile)
 
     return {
@@ -131,17 +115,19 @@ async def change_email(user_data: ChangeEmailData,
                        authorization: Optional[str] = Header(None),
                        db: AsyncSession = Depends(get_db)):
     scheme, token = authorization.split()
-    user = await find_user_by_token(token, db)
+    user = await get_current_principal(token, db)
     reset_token = create_access_token(
         data={"sub": str(user.id), "type": "email_reset"},
         expires_delta=timedelta(minutes=60)
     )
 
-    await send_email(
+    enqueue_email(
+        db,
         recipient_email=user.email,
         template_type="email_reset",
         subject="Смена почты",
         email_data={"reset_token": reset_token}
     )
+    await db.commit()
 
     return {'reset_token': reset_token, 'message': 'Успешно'}
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from database import get_db
+from cache import invalidate_catalog
 from models.subcategory import Subcategory as SubcategoryModel
 from schemas.subcategory import Subcategory, SubcategoryUpdate
 
@@ -21,6 +22,7 @@ async def update_subcategory(uid: int, subcategory: SubcategoryUpdate, db: Async
         setattr(db_subcategory, key, value)
 
     await db.commit()
+    invalidate_catalog()
     await db.refresh(db_subcategory)
     return db_subcategory
 
@@ -33,6 +35,7 @@ async def delete_subcategory(uid: int, db: AsyncSession = Depends(get_db)) -> No
 
     await db.delete(db_subcategory)
     await db.commit()
+    invalidate_catalog()
     return
 
 
@@ -60,5 +63,6 @@ async def create_product(subcategory_id: int, product: ProductCreate, db: AsyncS
     new_product = ProductModel(subcategory_id=subcategory_id, **product.model_dump())
     db.add(new_product)
     await db.commit()
+    invalidate_catalog()
     await db.refresh(new_product)
     return new_product
@@ -113,12 +113,43 @@ class InvoiceLoginCheckResponse(BaseModel):
     error: Optional[str] = None
 
 
+class SteamLoginCheckJobResponse(InvoiceLoginCheckResponse):
+    job_id: str = Field(..., description="The ID to poll the check with.")
+    status: Literal['process', 'ready'] = Field(..., description="'ready' once success/error are final.")
+
+
 class InvoicePendingResponse(BaseModel):
     invoices: Optional[list[Invoice]] = None
     error: Optional[str] = None
 
 
+class InvoiceClaimResponse(BaseModel):
+    claim_token: Optional[str] = Field(None, description="Token to acknowledge the claimed invoices with.")
+    lease_expires_at: Optional[datetime] = Field(None, description="Unacknowledged invoices are reclaimable after it.")
+    invoices: list[Invoice] = []
+    error: Optional[str] = None
+
+
+class InvoiceAckRequest(BaseModel):
+    claim_token: str
+    uuids: list[str] = Field(..., min_length=1, max_length=1000)
+    status: Literal[InvoiceStatus.process, InvoiceStatus.order_ok, InvoiceStatus.order_error] = Field(
+        InvoiceStatus.process, description="The status to set on the acknowledged invoices.")
+
+
+class InvoiceAckResponse(BaseModel):
+    acked: list[str] = []
+    rejected: list[str] = Field([], description="Invoices that are not held by this claim (lease expired or unknown).")
+    error: Optional[str] = None
+
+
 class InvoicePaymentIdResponse(BaseModel):
     invoice: Optional[Invoice] = None
     payment_invoice: Optional[PaymentInvoiceSchema] = None
     error: Optional[str] = None
+
+
+class InvoiceStatusEvent(BaseModel):
+    uuid: str
+    status: Optional[InvoiceStatus] = Field(None, description="The new status of the invoice, if it changed.")
+    payment_status: Optional[str] = Field(None, description="The status reported by the payment provider.")
@@ -2,6 +2,8 @@ from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Literal, Dict, Any
 from schemas.subcategory import Subcategory
 
+CurrencyCode = Literal['RUB', 'KZT', 'USD']
+
 
 class ProductBase(BaseModel):
     name: str
@@ -28,6 +30,8 @@ class ProductListResponse(BaseModel):
 
 class ProductListGetAllResponse(ProductListResponse):
     success: bool
+    next_cursor: Optional[int] = None
+    currency: Optional[CurrencyCode] = None
 
 
 class ProductPlainSchema(ProductBase):
@@ -43,6 +47,37 @@ class GiftListResponse(BaseModel):
 
 class GiftListGetAllResponse(GiftListResponse):
     success: bool
+    next_cursor: Optional[int] = None
+    currency: Optional[CurrencyCode] = None
+
+
+class ProductCard(BaseModel):
+    """
+    Облегченная карточка товара для списков; заполняются только запрошенные через fields= поля.
+    """
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    image_url: Optional[str] = None
+    preview_image_url: Optional[str] = None
+    subcategory_id: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductCardListResponse(BaseModel):
+    products: List[ProductCard]
+    success: bool
+    next_cursor: Optional[int] = None
+    currency: Optional[CurrencyCode] = None
+
+
+class GiftCardListResponse(BaseModel):
+    gifts: List[ProductCard]
+    success: bool
+    next_cursor: Optional[int] = None
+    currency: Optional[CurrencyCode] = None
 
 
 class ProductOptionBase(BaseModel):
@@ -118,6 +153,7 @@ class ProductGetByIdResponse(BaseModel):
     data: ProductFull
     success: bool
     currencies: Currencies
+    currency: Optional[CurrencyCode] = None
 
 
 class GiftFull(Product):
@@ -132,6 +168,7 @@ class GiftFull(Product):
 class GiftGetByIdResponse(BaseModel):
     data: GiftFull
     success: bool
+    currency: Optional[CurrencyCode] = None
 
 
 class ProductOptionCreate(BaseModel):
@@ -163,6 +200,36 @@ class BatchGiftCreateRequest(BaseModel):
     gifts: List[GiftCreate]
 
 
+class ImportChunk(BaseModel):
+    size: int
+    created: int
+    updated: int
+    seconds: float
+
+
 class BatchGiftCreateResponse(BaseModel):
     success: bool
     created_product_ids: List[int]
+    chunks: List[ImportChunk] = []
+
+
+class CatalogProductRow(ProductBase):
+    """
+    Строка импорта/экспорта каталога (NDJSON или CSV). Строки с id или steam_game_id
+    обновляют существующий товар, его опции, алиасы, FAQ и поля доставки заменяются целиком.
+    """
+    id: Optional[int] = None
+    subcategory_id: int
+    steam_game_id: Optional[int] = None
+    price: Optional[float] = None
+    options: List[ProductOptionCreate] = []
+    aliases: List[str] = []
+    faq: List[FaqSchema] = []
+    delivery_inputs: List[ProductDeliveryBase] = []
+
+
+class CatalogImportResponse(BaseModel):
+    success: bool
+    imported: int = 0
+    chunks: List[ImportChunk] = []
+    error: Optional[str] = None
@@ -0,0 +1,138 @@
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from metrics import METRICS_TOKEN
+
+# Включается явно через SQL_PROFILE=1 или автоматически в тестовом окружении
+SQL_PROFILE = bool(os.getenv("SQL_PROFILE") or os.getenv("IS_TEST"))
+SQL_PROFILE_KEEP = int(os.getenv("SQL_PROFILE_KEEP", 20))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", 3))
+
+logger = logging.getLogger('Gamemoneta.site.sql')
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    statements: list[tuple[str, float]] = field(default_factory=list)
+
+    @property
+    def sql_seconds(self) -> float:
+        return sum(duration for _, duration in self.statements)
+
+    def repeated(self) -> dict[str, int]:
+        """Одинаковые (с точностью до параметров) запросы, выполненные N_PLUS_ONE_THRESHOLD и более раз."""
+        counts = Counter(statement for statement, _ in self.statements)
+        return {statement: count for statement, count in counts.items() if count >= N_PLUS_ONE_THRESHOLD}
+
+    def summary(self, elapsed: Optional[float] = None) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "elapsed_ms": round(elapsed * 1000, 3) if elapsed is not None else None,
+            "queries": len(self.statements),
+            "sql_ms": round(self.sql_seconds * 1000, 3),
+            "repeated": [{"statement": statement, "count": count} for statement, count in self.repeated().items()],
+            "statements": [{"statement": statement, "ms": round(duration * 1000, 3)}
+                           for statement, duration in self.statements],
+        }
+
+
+_current: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("sql_profile", default=None)
+_worst: list[tuple[float, dict]] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["sql_profile_started"].pop()
+    profile = _current.get()
+    if profile is not None:
+        profile.statements.append((statement, time.perf_counter() - started))
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается для упавшего запроса
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("sql_profile_started"):
+        conn.info["sql_profile_started"].pop()
+
+
+def attach(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+def _record(profile: RequestProfile, elapsed: float) -> None:
+    repeated = profile.repeated()
+    if repeated:
+        worst_statement, count = max(repeated.items(), key=lambda item: item[1])
+        logger.warning(f"Possible N+1 in {profile.method} {profile.path}: {count}x {worst_statement[:200]}")
+
+    _worst.append((profile.sql_seconds, profile.summary(elapsed)))
+    _worst.sort(key=lambda item: item[0], reverse=True)
+    del _worst[SQL_PROFILE_KEEP:]
+
+
+class SQLProfilerMiddleware:
+    """
+    Собирает все SQL-запросы HTTP-запроса с их временем. В ответ добавляются заголовки
+    X-SQL-Queries, X-SQL-Time-Ms и X-SQL-Repeated (число запросов, похожих на N+1);
+    самые тяжелые по времени SQL запросы доступны в GET /api/debug/sql.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(method=scope["method"], path=scope["path"])
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers += [
+                    (b"x-sql-queries", str(len(profile.statements)).encode()),
+                    (b"x-sql-time-ms", f"{profile.sql_seconds * 1000:.3f}".encode()),
+                    (b"x-sql-repeated", str(sum(profile.repeated().values())).encode()),
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if profile.statements:
+                _record(profile, time.perf_counter() - started)
+
+
+router = APIRouter()
+
+
+@router.get("/sql", include_in_schema=False)
+async def worst_requests(reset: bool = False, authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+    result = [summary for _, summary in _worst]
+    if reset:
+        _worst.clear()
+    return {"threshold": N_PLUS_ONE_THRESHOLD, "requests": result}
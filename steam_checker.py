@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from uuid import uuid4
+
+import httpx
+
+from cache import TTLCache, ResultCache, shared_backend
+from http_clients import get_http_client
+from utils import is_valid_steam_login, STEAM_LOGIN_TOKEN, STEAM_LOGIN_URL
+
+STEAM_CHECK_MAX_WAIT = float(os.getenv("STEAM_CHECK_MAX_WAIT", 120))
+STEAM_CHECK_RESULT_TTL = float(os.getenv("STEAM_CHECK_RESULT_TTL", 600))
+STEAM_CHECK_NEGATIVE_TTL = float(os.getenv("STEAM_CHECK_NEGATIVE_TTL", 60))
+STEAM_CHECK_CACHE_SIZE = int(os.getenv("STEAM_CHECK_CACHE_SIZE", 10000))
+INITIAL_POLL_DELAY = 1.0
+BACKOFF_FACTOR = 2
+MAX_POLL_DELAY = 16.0
+
+INVALID_LOGIN_ERROR = "Проверьте правильность логина"
+UNAVAILABLE_ERROR = (
+    "Нет возможности пополнить данный аккаунт, если вы уверены, "
+    "что регион вашего аккаунта верный - повторите попытку позже."
+)
+
+logger = logging.getLogger('Gamemoneta.site.steam')
+
+
+@dataclass
+class SteamLoginJob:
+    login: str
+    id: str = field(default_factory=lambda: str(uuid4()))
+    status: str = "process"  # process | ready
+    success: Optional[bool] = None
+    error: Optional[str] = None
+    trans_id: Optional[str] = None
+    deadline: float = 0.0
+    next_poll_at: float = 0.0
+    poll_delay: float = INITIAL_POLL_DELAY
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def as_result(self) -> dict:
+        return {"success": bool(self.success), "error": self.error}
+
+
+class SteamLoginChecker:
+    """
+    Проверка Steam-логинов через внешний сервис без удержания HTTP-запроса клиента.
+
+    submit() отправляет check_steam_login и возвращает задачу; один фоновый поллер опрашивает
+    get_steam_response для всех незавершенных trans_id сразу, с экспоненциальной задержкой
+    для каждой задачи и общим лимитом ожидания STEAM_CHECK_MAX_WAIT. Повторные проверки того же
+    логина получают уже идущую задачу или результат из кэша: успешные проверки живут
+    STEAM_CHECK_RESULT_TTL, отказы - STEAM_CHECK_NEGATIVE_TTL. Временные ошибки апстрима не кэшируются.
+    """
+
+    def __init__(self):
+        self._jobs = TTLCache(maxsize=STEAM_CHECK_CACHE_SIZE, ttl=STEAM_CHECK_MAX_WAIT + STEAM_CHECK_NEGATIVE_TTL)
+        self._pending: Dict[str, SteamLoginJob] = {}
+        self._results = ResultCache(
+            "steam_login",
+            maxsize=STEAM_CHECK_CACHE_SIZE,
+            positive_ttl=STEAM_CHECK_RESULT_TTL,
+            negative_ttl=STEAM_CHECK_NEGATIVE_TTL,
+            backend=shared_backend(),
+            is_positive=lambda result: result["success"],
+        )
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def get(self, job_id: str) -> Optional[SteamLoginJob]:
+        return self._jobs.get(job_id)
+
+    async def submit(self, login: str) -> SteamLoginJob:
+        pending = self._pending.get(login)
+        if pending is not None:
+            return pending
+
+        if not is_valid_steam_login(login):
+            job = SteamLoginJob(login=login)
+            self._jobs.set(job.id, job)
+            self._finish(job, False, INVALID_LOGIN_ERROR, cache=False)
+            return job
+
+        # Регистрируем задачу до первого await, чтобы одновременные проверки логина ее разделили
+        job = SteamLoginJob(login=login)
+        self._jobs.set(job.id, job)
+        self._pending[login] = job
+
+        try:
+            await self._start(job)
+        finally:
+            # Любой выход без trans_id (ошибка, отмена) - задача не должна остаться в _pending навсегда
+            if job.status == "process" and not job.trans_id:
+                self._finish(job, False, UNAVAILABLE_ERROR, cache=False)
+        return job
+
+    async def _start(self, job: SteamLoginJob) -> None:
+        cached = await self._results.get(job.login)
+        if cached is not None:
+            self._finish(job, cached["success"], cached["error"], cache=False)
+            return
+
+        try:
+            check = await get_http_client("steam").get(
+                f"{STEAM_LOGIN_URL}check_steam_login",
+                params={"api_key": STEAM_LOGIN_TOKEN, "steam_login": job.login, "steam_value": 26}
+            )
+            check.raise_for_status()
+            check = check.json()
+            success, trans_id = check["success"], check.get("request_id")
+            if success and not trans_id:
+                raise ValueError("no request_id in response")
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Steam login check failed for {job.login}: {e!r}")
+            return
+
+        if not success:
+            self._finish(job, False, INVALID_LOGIN_ERROR)
+            return
+
+        now = time.monotonic()
+        job.trans_id = trans_id
+        job.deadline = now + STEAM_CHECK_MAX_WAIT
+        job.next_poll_at = now + job.poll_delay
+        self._ensure_poller()
+
+    async def wait(self, job: SteamLoginJob, timeout: float) -> SteamLoginJob:
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+    def _finish(self, job: SteamLoginJob, success: bool, error: Optional[str], cache: bool = True) -> None:
+        job.status = "ready"
+        job.success = success
+        job.error = None if success else error
+        job.done.set()
+        if self._pending.get(job.login) is job:
+            del self._pending[job.login]
+        if cache:
+            self._results.set(job.login, job.as_result())
+
+    def _ensure_poller(self) -> None:
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_loop(), name="steam-login-poller")
+        else:
+            self._wakeup.set()
+
+    async def _poll_loop(self) -> None:
+        while True:
+            try:
+                if not await self._poll_round():
+                    return
+            except Exception as e:
+                # Поллер общий для всех проверок: ошибка в одной не должна оставить остальные без ответа
+                logger.error(f"Steam poller iteration failed: {e!r}")
+                await asyncio.sleep(INITIAL_POLL_DELAY)
+
+    async def _poll_round(self) -> bool:
+        """Опрашивает задачи, которым пора, и ждет следующей. Returns: остались ли задачи."""
+        jobs = [job for job in self._pending.values() if job.trans_id]
+        if not jobs:
+            return False
+
+        now = time.monotonic()
+        for job in jobs:
+            if job.deadline <= now:
+                self._finish(job, False, UNAVAILABLE_ERROR, cache=False)
+
+        due = [job for job in jobs if job.status == "process" and job.next_poll_at <= now]
+        if due:
+            await asyncio.gather(*(self._poll(job) for job in due))
+
+        upcoming = [job.next_poll_at for job in self._pending.values() if job.trans_id]
+        if upcoming:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(min(upcoming) - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def _poll(self, job: SteamLoginJob) -> None:
+        try:
+            response = await get_http_client("steam").get(
+                f"{STEAM_LOGIN_URL}get_steam_response",
+                params={"api_key": STEAM_LOGIN_TOKEN, "trans_id": job.trans_id}
+            )
+            response.raise_for_status()
+            data = response.json()
+            if not isinstance(data, dict):
+                raise ValueError(f"unexpected response {type(data).__name__}")
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Steam response poll failed for {job.login}: {e}")
+            data = {"status": "process"}
+
+        if data.get("status") == "process":
+            job.poll_delay = min(job.poll_delay * BACKOFF_FACTOR, MAX_POLL_DELAY)
+            job.next_poll_at = time.monotonic() + job.poll_delay
+            return
+
+        result = data.get("response")
+        if data.get("status") == "ready" and isinstance(result, dict) and result.get("success"):
+            self._finish(job, True, None)
+        else:
+            self._finish(job, False, UNAVAILABLE_ERROR)
+
+
+steam_login_checker = SteamLoginChecker()
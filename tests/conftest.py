@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Переменные, без которых модули приложения не импортируются; база и апстримы в тестах не нужны
+for key, value in {
+    "IS_TEST": "1",
+    "JWT_SECRET": "test-secret",
+    "SECRET_DIGI": "test-digi",
+    "TELEGRAM_BOT_TOKEN": "0:test",
+    "MYSQL_USER": "test",
+    "MYSQL_PASSWORD": "test",
+    "MYSQL_DATABASE": "test",
+    "MYSQL_HOST": "localhost",
+    "MYSQL_PORT": "3306",
+    "STEAM_LOGIN_URL": "https://steam.test/",
+    "LOG_FILE_PATH": os.path.join(tempfile.gettempdir(), "gamemoneta-tests.log"),
+}.items():
+    os.environ.setdefault(key, value)
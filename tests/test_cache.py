@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+
+from cache import CatalogCache, CatalogInvalidations, ResultCache
+
+
+def make_cache() -> ResultCache:
+    return ResultCache("test", maxsize=10, positive_ttl=60, negative_ttl=0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_share_one_call():
+    cache = make_cache()
+    calls = []
+    release = asyncio.Event()
+
+    async def load():
+        calls.append(1)
+        await release.wait()
+        return "value"
+
+    tasks = [asyncio.create_task(cache.get_or_load("key", load)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["value"] * 3
+    assert len(calls) == 1
+    assert await cache.get_or_load("key", load) == "value" and len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_load_error_reaches_all_waiters_and_is_not_cached():
+    cache = make_cache()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise ConnectionError("down")
+
+    tasks = [asyncio.create_task(cache.get_or_load("key", failing)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert await cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_waiters():
+    cache = make_cache()
+    calls = []
+    release = asyncio.Event()
+
+    async def load():
+        calls.append(1)
+        await release.wait()
+        return f"value {len(calls)}"
+
+    leader = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get_or_load("key", load)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    release.set()
+
+    # Один из ожидающих повторяет загрузку, второй получает ее результат
+    assert await asyncio.gather(*waiters) == ["value 2", "value 2"]
+    assert len(calls) == 2
+    assert not any(waiter.cancelled() for waiter in waiters)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_affect_leader():
+    cache = make_cache()
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        return "value"
+
+    leader = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("key", load))
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    release.set()
+
+    assert await leader == "value"
+    assert waiter.cancelled()
+
+
+class FakeRedis:
+    """Общий для нескольких "воркеров" pub/sub: publish раздает сообщение всем подписчикам канала."""
+
+    def __init__(self):
+        self.subscribers: dict[str, list[asyncio.Queue]] = {}
+
+    async def publish(self, channel, data):
+        for queue in self.subscribers.get(channel, []):
+            queue.put_nowait({"type": "message", "channel": channel, "data": data})
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        for queues in self.redis.subscribers.values():
+            if self.queue in queues:
+                queues.remove(self.queue)
+
+    async def subscribe(self, channel):
+        self.redis.subscribers.setdefault(channel, []).append(self.queue)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+
+@pytest.mark.asyncio
+async def test_catalog_invalidation_reaches_other_workers():
+    redis = FakeRedis()
+    caches = [CatalogCache(maxsize=10, ttl=300) for _ in range(2)]
+    workers = [CatalogInvalidations(cache, channel="test") for cache in caches]
+    for worker in workers:
+        await worker.start(redis)
+    try:
+        while len(redis.subscribers.get("test", [])) < 2:
+            await asyncio.sleep(0)
+        for cache in caches:
+            cache.set("products", b"[]")
+
+        caches[0].invalidate()
+        workers[0].publish()
+        while caches[1].get("products") is not None:
+            await asyncio.sleep(0)
+
+        assert (workers[0].received, workers[1].received) == (0, 1)
+    finally:
+        for worker in workers:
+            await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_catalog_invalidation_without_shared_backend_is_local():
+    worker = CatalogInvalidations(CatalogCache(maxsize=10, ttl=300))
+    await worker.start()
+
+    worker.publish()
+    assert worker.stats == {"shared": False, "received": 0}
+    await worker.stop()
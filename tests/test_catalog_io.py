@@ -0,0 +1,67 @@
+import pytest
+
+from catalog_io import CSV_COLUMNS, CatalogImportError, iter_lines, parse_csv, to_csv
+
+HEADER = ",".join(CSV_COLUMNS)
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+async def parse(lines) -> list:
+    return [row async for row in parse_csv(aiter(lines))]
+
+
+@pytest.mark.asyncio
+async def test_quoted_newlines_continue_the_record():
+    rows = await parse([
+        HEADER,
+        '1,2,,Game,"First line',
+        'second ""quoted"" line',
+        '",100,,,"[{""type"": ""select"",',
+        '""option_name"": ""region""}]",[],[],[]',
+        ',3,,Other,,50,,,,,,',
+    ])
+
+    (first_line, first), (second_line, second) = rows
+    assert first_line == 2 and second_line == 6
+    assert first["description"] == 'First line\nsecond "quoted" line\n'
+    assert first["options"] == [{"type": "select", "option_name": "region"}]
+    assert first["aliases"] == []
+    assert second["id"] is None and second["name"] == "Other" and second["options"] == []
+
+
+@pytest.mark.asyncio
+async def test_blank_lines_are_skipped():
+    rows = await parse([HEADER, "", ',3,,Other,,50,,,,,,', ""])
+    assert [line for line, _ in rows] == [3]
+
+
+@pytest.mark.asyncio
+async def test_unterminated_quote_reports_record_start():
+    with pytest.raises(CatalogImportError) as error:
+        await parse([HEADER, ',3,,Other,"never closed', "more", "text"])
+    assert error.value.line == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_list_json_reports_line():
+    with pytest.raises(CatalogImportError) as error:
+        await parse([HEADER, ',3,,Other,,50,,,[not json,,,'])
+    assert error.value.line == 2 and "options" in str(error.value)
+
+
+@pytest.mark.asyncio
+async def test_export_round_trips_through_import():
+    item = {column: None for column in CSV_COLUMNS}
+    item.update(id=7, subcategory_id=2, name="Game", description='Multi\nline, "quoted"\ntext', price=100,
+                options=[{"title": "a\nb"}], aliases=[], faq=[], delivery_inputs=[])
+
+    chunks = [chunk async for chunk in to_csv(aiter([item]))]
+    [(_, row)] = [row async for row in parse_csv(iter_lines(aiter(chunks)))]
+
+    assert row["description"] == 'Multi\nline, "quoted"\ntext'
+    assert row["options"] == [{"title": "a\nb"}]
+    assert row["id"] == "7" and row["name"] == "Game"
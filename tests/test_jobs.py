@@ -0,0 +1,108 @@
+import datetime as dt
+
+import pytest
+
+import jobs
+from jobs import JobWorker, backoff_delay, job_handler
+from models.outbox import utcnow
+
+
+class FakeSession:
+    """Запоминает значения UPDATE, которые JobWorker._execute пишет в outbox_jobs."""
+
+    def __init__(self, updates: list):
+        self.updates = updates
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.updates.append({column.key: value.value for column, value in statement._values.items()})
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def worker():
+    updates = []
+    worker = JobWorker(session_factory=lambda: FakeSession(updates), concurrency=0)
+    worker.updates = updates
+    return worker
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "_handlers", {})
+
+    @job_handler("ok")
+    async def ok(payload):
+        calls.append(payload)
+
+    @job_handler("flaky")
+    async def flaky(payload):
+        raise ConnectionError("upstream is down")
+
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_successful_job_is_done(worker, handlers):
+    await worker._execute(1, "ok", {"n": 1}, attempts=1, max_attempts=3)
+
+    assert handlers == [{"n": 1}]
+    assert worker.updates == [{"status": "done", "locked_until": None}]
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_with_backoff(worker, handlers, monkeypatch):
+    monkeypatch.setattr(jobs, "backoff_delay", lambda attempts: 10 * attempts)
+    before = utcnow()
+    await worker._execute(1, "flaky", {}, attempts=2, max_attempts=3)
+
+    [values] = worker.updates
+    assert values["status"] == "pending" and values["locked_until"] is None
+    assert values["last_error"] == "ConnectionError: upstream is down"
+    assert before + dt.timedelta(seconds=20) <= values["available_at"] <= utcnow() + dt.timedelta(seconds=20)
+
+
+@pytest.mark.asyncio
+async def test_job_is_dead_after_last_attempt(worker, handlers):
+    await worker._execute(1, "flaky", {}, attempts=3, max_attempts=3)
+
+    [values] = worker.updates
+    assert values["status"] == "dead"
+    assert "available_at" not in values
+    assert values["last_error"] == "ConnectionError: upstream is down"
+
+
+@pytest.mark.asyncio
+async def test_unknown_kind_counts_as_failed_attempt(worker, handlers):
+    await worker._execute(1, "missing", {}, attempts=1, max_attempts=1)
+
+    [values] = worker.updates
+    assert values["status"] == "dead"
+    assert values["last_error"].startswith("LookupError: No handler registered for job kind 'missing'")
+
+
+@pytest.mark.asyncio
+async def test_run_once_executes_claimed_jobs(worker, handlers, monkeypatch):
+    async def claim():
+        return [(1, "ok", {"n": 1}, 1, 3), (2, "flaky", {}, 3, 3)]
+
+    monkeypatch.setattr(worker, "_claim", claim)
+
+    assert await worker.run_once() == 2
+    assert [values["status"] for values in worker.updates] == ["done", "dead"]
+
+
+def test_backoff_grows_exponentially_up_to_max(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_BASE", 5)
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_MAX", 60)
+
+    for attempts, delay in [(1, 5), (2, 10), (3, 20), (4, 40), (5, 60), (10, 60)]:
+        assert delay <= backoff_delay(attempts) <= delay * 1.1
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from schemas.lava import LavaInvoiceCreateResponse
+
+
+async def lava_routes(monkeypatch, post_payment):
+    # utils запускает планировщик при импорте, а ему нужен работающий event loop
+    from routes import lava
+
+    monkeypatch.setattr(lava, "_post_payment", post_payment)
+    monkeypatch.setattr(lava, "_pending_payments", {})
+    lava._created_payments.clear()
+    return lava
+
+
+def created(invoice_id: str) -> LavaInvoiceCreateResponse:
+    return LavaInvoiceCreateResponse.model_validate({
+        "data": {"id": invoice_id, "amount": 100, "expired": "2026-01-01 00:00:00", "status": 1,
+                 "shop_id": "shop", "url": f"https://lava.test/{invoice_id}", "merchantName": "shop"},
+        "status": 200,
+        "status_check": True,
+    })
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_create_one_payment(monkeypatch):
+    calls = []
+    release = asyncio.Event()
+
+    async def post_payment(payment_data):
+        calls.append(payment_data["orderId"])
+        await release.wait()
+        return created("lava-1")
+
+    lava = await lava_routes(monkeypatch, post_payment)
+    tasks = [asyncio.create_task(lava.create_payment(100, "order-1")) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert {response.data.id for response in await asyncio.gather(*tasks)} == {"lava-1"}
+    assert (await lava.create_payment(100, "order-1")).data.id == "lava-1"
+    assert calls == ["order-1"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_waiters(monkeypatch):
+    calls = []
+    release = asyncio.Event()
+
+    async def post_payment(payment_data):
+        calls.append(payment_data["orderId"])
+        await release.wait()
+        return created("lava-1")
+
+    lava = await lava_routes(monkeypatch, post_payment)
+    leader = asyncio.create_task(lava.create_payment(100, "order-1"))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(lava.create_payment(100, "order-1"))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    release.set()
+
+    assert (await waiter).data.id == "lava-1"
+    assert calls == ["order-1"]
+
+
+@pytest.mark.asyncio
+async def test_failed_payment_is_not_reused(monkeypatch):
+    attempts = []
+
+    async def post_payment(payment_data):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("lava is down")
+        return created("lava-2")
+
+    lava = await lava_routes(monkeypatch, post_payment)
+    with pytest.raises(ConnectionError):
+        await lava.create_payment(100, "order-1")
+
+    assert (await lava.create_payment(100, "order-1")).data.id == "lava-2"
+    assert not lava._pending_payments
@@ -0,0 +1,47 @@
+import re
+
+import pytest
+
+from metrics import Counter, render_metrics
+
+
+def families(text: str) -> dict:
+    """Имя семейства из TYPE -> имена его сэмплов."""
+    result, current = {}, None
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            current = line.split()[2]
+            result[current] = set()
+        elif line and not line.startswith("#"):
+            result[current].add(re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group())
+    return result
+
+
+def test_counter_samples_are_named_like_their_family():
+    counter = Counter("test_events_total", "Test events.", ("kind",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+
+    assert counter.render().splitlines() == [
+        "# HELP test_events_total Test events.",
+        "# TYPE test_events_total counter",
+        'test_events_total{kind="a"} 3',
+    ]
+
+
+def test_counter_name_requires_total_suffix():
+    with pytest.raises(ValueError):
+        Counter("test_events", "Test events.")
+
+
+def test_all_samples_belong_to_their_declared_family():
+    from metrics import HTTP_LATENCY, HTTP_REQUESTS
+    from rate_limit import RATE_LIMITED
+
+    HTTP_REQUESTS.inc("GET", "/api/test", "200")
+    HTTP_LATENCY.observe(0.01, "GET", "/api/test")
+    RATE_LIMITED.inc("test")
+
+    for family, samples in families(render_metrics()).items():
+        for sample in samples:
+            assert sample == family or sample in {f"{family}_bucket", f"{family}_sum", f"{family}_count"}
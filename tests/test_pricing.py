@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+import pytest
+
+from currency_rates import RatesSnapshot
+from pricing import PriceTable, convert_price
+
+RATES = RatesSnapshot(KZT=0.2, USD=8, update_time=0)
+
+
+@pytest.mark.parametrize("amount, currency, expected", [
+    # Половина округляется вверх, без ошибок двоичного float
+    (10.005, "RUB", 10.01),
+    (10.004, "RUB", 10.0),
+    (0.1 + 0.2, "RUB", 0.3),
+    (Decimal("99.995"), "RUB", 100.0),
+    # Тенге - без копеек
+    (100.1, "KZT", 501.0),
+    (100.3, "KZT", 502.0),
+    (1000, "USD", 125.0),
+    (0.2, "USD", 0.03),
+    (0.1, "USD", 0.01),
+])
+def test_convert_price_rounding(amount, currency, expected):
+    assert convert_price(amount, currency, RATES) == expected
+
+
+@pytest.mark.parametrize("amount", [None, True, "12", {"price": 1}])
+def test_convert_price_keeps_non_numbers(amount):
+    assert convert_price(amount, "USD", RATES) == amount
+
+
+def test_price_table_converts_option_prices():
+    table = PriceTable(maxsize=10)
+    product = {"id": 1, "price": 1000, "options": [
+        {"items": [{"name": "x", "price": 80}], "item": {"price": 8}, "default_value": None},
+    ]}
+
+    assert table.localized(product, "USD", RATES) == {"price": 125.0, "options": [
+        {"items": [{"name": "x", "price": 10.0}], "item": {"price": 1.0}, "default_value": None},
+    ]}
+
+
+def test_price_table_recomputes_changed_product():
+    table = PriceTable(maxsize=10)
+    product = {"id": 1, "price": 1000}
+
+    assert table.localized(product, "USD", RATES) == {"price": 125.0}
+    assert table.localized(product, "USD", RATES) == {"price": 125.0}
+    assert table.localized({"id": 1, "price": 2000}, "USD", RATES) == {"price": 250.0}
+    assert (table.hits, table.misses) == (1, 2)
+
+    new_rates = RatesSnapshot(KZT=0.2, USD=10, update_time=1, version=1)
+    assert table.localized(product, "USD", new_rates) == {"price": 100.0}
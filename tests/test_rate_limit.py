@@ -0,0 +1,187 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import rate_limit
+from rate_limit import CoalescingMiddleware, LocalTokenBuckets, RateLimitMiddleware, RateLimitRule
+
+LOGIN_RULE = RateLimitRule("login", per_minute=60, burst=2, routes=(("POST", "/api/auth/login"),))
+DEFAULT_RULE = RateLimitRule("default", per_minute=6000, burst=100)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Подменяем модуль time только в rate_limit: часы event loop трогать нельзя
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def client_for(app, ip: str = "10.0.0.1") -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(ip, 1234)), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_refills(clock):
+    buckets = LocalTokenBuckets(maxsize=10)
+
+    assert await buckets.take("login:ip", LOGIN_RULE) == (True, 0.0)
+    assert await buckets.take("login:ip", LOGIN_RULE) == (True, 0.0)
+    allowed, retry_after = await buckets.take("login:ip", LOGIN_RULE)
+    assert not allowed and retry_after == pytest.approx(1.0)
+
+    clock.now += 0.5
+    allowed, retry_after = await buckets.take("login:ip", LOGIN_RULE)
+    assert not allowed and retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert (await buckets.take("login:ip", LOGIN_RULE))[0]
+    # Другой ключ - своя полная корзина
+    assert (await buckets.take("login:other", LOGIN_RULE))[0]
+
+
+@pytest.mark.asyncio
+async def test_bucket_never_exceeds_burst(clock):
+    buckets = LocalTokenBuckets(maxsize=10)
+    await buckets.take("login:ip", LOGIN_RULE)
+    clock.now += 3600
+
+    results = [(await buckets.take("login:ip", LOGIN_RULE))[0] for _ in range(3)]
+    assert results == [True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_middleware_returns_429_with_retry_after(clock, monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_LOGIN", raising=False)
+    app = RateLimitMiddleware(ok_app, rules=[LOGIN_RULE], default_rule=DEFAULT_RULE)
+
+    async with client_for(app) as client:
+        codes = [(await client.post("/api/auth/login")).status_code for _ in range(2)]
+        denied = await client.post("/api/auth/login")
+        other_route = await client.get("/api/products/")
+
+    assert codes == [200, 200]
+    assert denied.status_code == 429
+    assert denied.headers["retry-after"] == "1"
+    assert denied.json() == {"detail": "Too many requests"}
+    assert other_route.status_code == 200
+
+    async with client_for(app, ip="10.0.0.2") as client:
+        assert (await client.post("/api/auth/login")).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_middleware_budget_from_env(clock, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_LOGIN", "60,1")
+    app = RateLimitMiddleware(ok_app, rules=[LOGIN_RULE], default_rule=DEFAULT_RULE)
+
+    async with client_for(app) as client:
+        codes = [(await client.post("/api/auth/login")).status_code for _ in range(2)]
+    assert codes == [200, 429]
+
+
+@pytest.mark.asyncio
+async def test_middleware_falls_back_to_local_buckets(clock, monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_LOGIN", raising=False)
+
+    class BrokenBackend:
+        async def take(self, key, rule):
+            raise ConnectionError("shared store is down")
+
+    app = RateLimitMiddleware(ok_app, rules=[LOGIN_RULE], default_rule=DEFAULT_RULE)
+    app._shared = BrokenBackend()
+
+    async with client_for(app) as client:
+        codes = [(await client.post("/api/auth/login")).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+
+
+class SlowApp:
+    """Отвечает номером вызова; пока gate не открыт, ответ не отправляется."""
+
+    def __init__(self, fail_first: bool = False, chunks: int = 1):
+        self.calls = 0
+        self.fail_first = fail_first
+        self.chunks = chunks
+        self.gate = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        call = self.calls
+        await self.gate.wait()
+        if self.fail_first and call == 1:
+            raise RuntimeError("leader failed")
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        for chunk in range(self.chunks):
+            await send({"type": "http.response.body", "body": f"call {call};".encode(),
+                        "more_body": chunk < self.chunks - 1})
+
+
+async def burst(client: httpx.AsyncClient, app: SlowApp, requests: list) -> list:
+    tasks = [asyncio.create_task(request(client)) for request in requests]
+    # Даем всем запросам дойти до middleware, прежде чем первый ответит
+    for _ in range(20):
+        await asyncio.sleep(0)
+    app.gate.set()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_identical_gets_are_coalesced():
+    app = SlowApp()
+    async with client_for(CoalescingMiddleware(app)) as client:
+        responses = await burst(client, app, [lambda c: c.get("/api/products/?page=1")] * 10)
+
+    assert app.calls == 1
+    assert {response.text for response in responses} == {"call 1;"}
+
+
+@pytest.mark.asyncio
+async def test_different_requests_are_not_coalesced():
+    app = SlowApp()
+    async with client_for(CoalescingMiddleware(app)) as client:
+        await burst(client, app, [
+            lambda c: c.get("/api/products/?page=1"),
+            lambda c: c.get("/api/products/?page=2"),
+            lambda c: c.get("/api/products/?page=1", headers={"authorization": "Bearer token"}),
+            lambda c: c.post("/api/products/?page=1"),
+            lambda c: c.get("/api/catalog/export"),
+            lambda c: c.get("/api/catalog/export"),
+        ])
+
+    assert app.calls == 6
+
+
+@pytest.mark.asyncio
+async def test_followers_run_themselves_when_leader_fails():
+    app = SlowApp(fail_first=True)
+    async with client_for(CoalescingMiddleware(app)) as client:
+        responses = await burst(client, app, [lambda c: c.get("/api/gifts/")] * 3)
+
+    assert isinstance(responses[0], RuntimeError)
+    assert sorted(response.text for response in responses[1:]) == ["call 2;", "call 3;"]
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_not_replayed():
+    app = SlowApp(chunks=3)
+    async with client_for(CoalescingMiddleware(app, max_body=10)) as client:
+        responses = await burst(client, app, [lambda c: c.get("/api/products/")] * 2)
+
+    assert app.calls == 2
+    assert responses[1].text == "call 2;" * 3
@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from http_clients import close_http_clients, override_transport
+
+
+class SteamStub:
+    """Заглушка сервиса проверки логинов: ответы check_steam_login и get_steam_response по очереди."""
+
+    def __init__(self, check, poll=None):
+        self.check = check
+        self.poll = poll or {"status": "ready", "response": {"success": True}}
+        self.calls = []
+        self.release = asyncio.Event()
+        self.hold = False
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append(request.url.path)
+        if self.hold:
+            await self.release.wait()
+        payload = self.check if request.url.path.endswith("check_steam_login") else self.poll
+        if isinstance(payload, int):
+            return httpx.Response(payload)
+        return httpx.Response(200, json=payload)
+
+
+async def make_checker(stub: SteamStub):
+    # utils запускает планировщик при импорте, а ему нужен работающий event loop
+    from steam_checker import SteamLoginChecker
+
+    override_transport("steam", httpx.MockTransport(stub))
+    return SteamLoginChecker()
+
+
+async def close(checker) -> None:
+    await checker.stop()
+    await close_http_clients()
+
+
+@pytest.mark.asyncio
+async def test_submit_polls_until_ready_and_caches_result():
+    stub = SteamStub(check={"success": True, "request_id": "t1"})
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("gabe_newell")
+        assert job.status == "process" and job.trans_id == "t1"
+
+        await checker.wait(job, timeout=5)
+        assert job.status == "ready" and job.success is True and job.error is None
+        assert "gabe_newell" not in checker._pending
+
+        again = await checker.submit("gabe_newell")
+        assert again.success is True
+        assert stub.calls == ["/check_steam_login", "/get_steam_response"]
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_share_one_job():
+    stub = SteamStub(check={"success": True, "request_id": "t1"})
+    checker = await make_checker(stub)
+    try:
+        first, second = await asyncio.gather(checker.submit("gabe_newell"), checker.submit("gabe_newell"))
+        assert first is second
+        assert stub.calls == ["/check_steam_login"]
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_rejected_login_is_cached():
+    from steam_checker import INVALID_LOGIN_ERROR
+
+    stub = SteamStub(check={"success": False})
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("gabe_newell")
+        assert job.status == "ready" and job.success is False and job.error == INVALID_LOGIN_ERROR
+
+        await checker.submit("gabe_newell")
+        assert len(stub.calls) == 1
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_invalid_login_skips_upstream():
+    from steam_checker import INVALID_LOGIN_ERROR
+
+    stub = SteamStub(check={"success": True, "request_id": "t1"})
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("not a login!")
+        assert job.status == "ready" and job.error == INVALID_LOGIN_ERROR
+        assert stub.calls == []
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("check", [500, {"status": "ok"}, {"success": True}, ["unexpected"]])
+async def test_failed_check_releases_job(check):
+    from steam_checker import UNAVAILABLE_ERROR
+
+    stub = SteamStub(check=check)
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("gabe_newell")
+        assert job.status == "ready" and job.success is False and job.error == UNAVAILABLE_ERROR
+        assert job.done.is_set()
+        assert "gabe_newell" not in checker._pending
+
+        # Временная ошибка не кэшируется: следующая проверка снова идет в апстрим
+        retry = await checker.submit("gabe_newell")
+        assert retry is not job
+        assert len(stub.calls) == 2
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_submit_releases_job():
+    stub = SteamStub(check={"success": True, "request_id": "t1"})
+    stub.hold = True
+    checker = await make_checker(stub)
+    try:
+        task = asyncio.create_task(checker.submit("gabe_newell"))
+        while not stub.calls:
+            await asyncio.sleep(0)
+        job = checker._pending["gabe_newell"]
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert job.status == "ready" and job.done.is_set()
+        assert "gabe_newell" not in checker._pending
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_wait_returns_unfinished_job_on_timeout():
+    stub = SteamStub(check={"success": True, "request_id": "t1"}, poll={"status": "process"})
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("gabe_newell")
+        assert (await checker.wait(job, timeout=0.05)).status == "process"
+        assert checker._pending["gabe_newell"] is job
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("poll", [["unexpected"], "text", {"status": "ready", "response": ["unexpected"]}])
+async def test_malformed_poll_response_does_not_stop_poller(poll):
+    from steam_checker import UNAVAILABLE_ERROR
+
+    stub = SteamStub(check={"success": True, "request_id": "t1"}, poll=poll)
+    checker = await make_checker(stub)
+    try:
+        job = await checker.submit("gabe_newell")
+        # Первый опрос - через секунду, следующий после него - уже после дедлайна
+        job.deadline = time.monotonic() + 1.5
+
+        await checker.wait(job, timeout=5)
+        assert job.status == "ready" and job.error == UNAVAILABLE_ERROR
+        # Поллер завершается сам, когда задач не осталось, а не падает с исключением
+        assert await asyncio.wait_for(checker._poller, timeout=1) is None
+    finally:
+        await close(checker)
+
+
+@pytest.mark.asyncio
+async def test_poller_survives_unexpected_error(monkeypatch):
+    stub = SteamStub(check={"success": True, "request_id": "t1"})
+    checker = await make_checker(stub)
+    poll = checker._poll
+    failures = []
+
+    async def flaky_poll(job):
+        if not failures:
+            failures.append(job)
+            raise RuntimeError("unexpected")
+        await poll(job)
+
+    monkeypatch.setattr(checker, "_poll", flaky_poll)
+    try:
+        job = await checker.submit("gabe_newell")
+        await checker.wait(job, timeout=5)
+        assert failures and job.status == "ready" and job.success is True
+    finally:
+        await close(checker)
@@ -2,20 +2,27 @@ import hashlib
 import hmac
 import re
 
-from passlib.context import CryptContext
 import jwt
 import httpx
 
 from models import TokenBlacklist
-from models.user import User
+from models.user import User, OAuthProfile
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status, Header
 import requests
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, and_
 from sqlalchemy.future import select
-from database import get_db
+from database import get_db, AsyncSessionLocal
+from cache import TTLCache, ResultCache, BloomFilter
+from jobs import job_handler, enqueue, prune_done_jobs
+from models.outbox import utcnow
+from http_clients import get_http_client
+from passwords import password_hasher
 import os
+import time
 import datetime as dt
+from dataclasses import dataclass
 from typing import Optional, Literal, Dict, Any
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
@@ -35,6 +42,10 @@ EMAIL_API = os.getenv("EMAIL_API")
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", 300))
+AUTH_PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+TOKEN_BLACKLIST_SYNC_SECONDS = int(os.getenv("TOKEN_BLACKLIST_SYNC_SECONDS", 60))
 
 SECRET_DIGI = os.getenv("SECRET_DIGI")
 
@@ -43,34 +54,96 @@ API_LAVA_TOKEN = os.getenv("API_LAVA_TOKEN")
 LAVA_SUCCESS_URL = os.getenv("LAVA_SUCCESS_URL")
 LAVA_SHOP_ID = os.getenv("LAVA_SHOP_ID")
 
-url = f'http://195.161.62.92/steam_currency/get_currency_rate?api_key={STEAM_LOGIN_TOKEN}&code='
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-currencies = {
-    "KZT": 0.189490353604604,
-    "USD": 98.12,
-    "update_time": 1738793134
-}
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@dataclass(frozen=True)
+class Principal:
+    """Минимальные данные пользователя для авторизации, без ORM-объекта и сессии."""
+    id: int
+    email: Optional[str]
+    name: Optional[str]
+    photo: Optional[str]
+    is_active: bool
+    has_password: bool
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Подписанные claims проверенных токенов: повторная проверка того же токена не пересчитывает HMAC
+_token_claims = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL)
+_principals = ResultCache("principal", maxsize=AUTH_CACHE_SIZE,
+                          positive_ttl=AUTH_PRINCIPAL_CACHE_TTL, negative_ttl=0)
+_profiles = ResultCache("profile", maxsize=AUTH_CACHE_SIZE,
+                        positive_ttl=AUTH_PRINCIPAL_CACHE_TTL, negative_ttl=0)
 
-async def find_user_by_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+
+async def invalidate_user(user_id) -> None:
+    """Сбрасывает закэшированные Principal и профиль; вызывать после commit любых изменений пользователя."""
+    await _principals.delete(int(user_id))
+    await _profiles.delete(int(user_id))
+
+
+def token_user_id(payload: dict) -> int:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        if not sub:
-            raise HTTPException(status_code=403, detail="Invalid token payload")
-        user = (await db.execute(select(User).where(User.id == sub))).scalar_one_or_none()
-
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=403, detail="Invalid token")
+        return int(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=403, detail="Invalid token payload")
+
+
+async def find_user_by_token(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """ORM-объект пользователя для изменения. Если нужно только чтение - используйте get_current_principal."""
+    user = await db.get(User, token_user_id(decode_jwt(token)))
+
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def load_principal(user_id: int, db: AsyncSession) -> Principal:
+    async def load() -> Optional[Principal]:
+        row = (await db.execute(
+            select(User.id, User.email, User.name, User.photo, User.is_active, User.hashed_password)
+            .where(User.id == user_id)
+        )).one_or_none()
+        if row is None:
+            return None
+        return Principal(id=row.id, email=row.email, name=row.name, photo=row.photo,
+                         is_active=bool(row.is_active), has_password=bool(row.hashed_password))
+
+    principal = await _principals.get_or_load(user_id, load)
+    if principal is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return principal
+
+
+async def load_profile(user_id: int, db: AsyncSession) -> dict:
+    """Данные GET /api/profile/: пользователь и его Telegram одним запросом, кэшируются как Principal."""
+    async def load() -> Optional[dict]:
+        row = (await db.execute(
+            select(User.id, User.email, User.photo, User.name, User.gender, User.is_active, User.bonuses,
+                   OAuthProfile.oauth_id)
+            .outerjoin(OAuthProfile, and_(OAuthProfile.user_id == User.id, OAuthProfile.provider == "telegram"))
+            .where(User.id == user_id)
+            .limit(1)
+        )).one_or_none()
+        if row is None:
+            return None
+        return {"id": row.id, "email": row.email, "photo": row.photo, "name": row.name, "gender": row.gender,
+                "is_active": row.is_active, "bonuses": row.bonuses,
+                "telegramId": int(row.oauth_id) if row.oauth_id else None}
+
+    profile = await _profiles.get_or_load(user_id, load)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
+
+
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """id пользователя из токена; к базе не обращается."""
+    return token_user_id(decode_jwt(token))
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    return await load_principal(get_current_user_id(token), db)
 
 
 def create_access_token(data: dict, expires_delta: Optional[dt.timedelta] = dt.timedelta(minutes=30)):
@@ -87,13 +160,31 @@ def create_access_token(data: dict, expires_delta: Optional[dt.timedelta] = dt.t
 
 
 def decode_jwt(token: str) -> dict:
+    """
+    Raises:
+        HTTPException: 401 для истекшего токена, 403 для невалидного.
+    """
+    payload = _token_claims.get(token)
+    if payload is not None:
+        if payload.get("exp") is not None and payload["exp"] <= time.time():
+            _token_claims.delete(token)
+            raise HTTPException(status_code=401, detail="Token has expired")
+        return payload
+
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=403, detail="Invalid token")
 
+    ttl = AUTH_TOKEN_CACHE_TTL
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        _token_claims.set(token, payload, ttl=ttl)
+    return payload
+
 
 def verify_token(authorization: Optional[str] = Header(None)):
     """
@@ -113,11 +204,86 @@ def verify_token(authorization: Optional[str] = Header(None)):
     return decode_jwt(token)
 
 
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenBlacklistFilter:
+    """
+    Bloom-фильтр непросроченных записей token_blacklist. Пока фильтр загружен, проверка
+    "токен не использован" обходится без запроса в базу; положительный ответ фильтра
+    перепроверяется запросом.
+
+    Записи других процессов попадают в фильтр при sync() раз в TOKEN_BLACKLIST_SYNC_SECONDS.
+    Одноразовость гарантирует первичный ключ token_hash, а не фильтр.
+    """
+
+    def __init__(self):
+        self.bloom: Optional[BloomFilter] = None
+        self._recent: set[str] = set()
+
+    def add(self, key: str) -> None:
+        self._recent.add(key)
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def might_contain(self, key: str) -> bool:
+        return self.bloom is None or self.bloom.might_contain(key)
+
+    async def sync(self) -> None:
+        recent = set(self._recent)
+        async with AsyncSessionLocal() as db:
+            keys = (await db.execute(
+                select(TokenBlacklist.token_hash).where(TokenBlacklist.expires_at > utcnow())
+            )).scalars().all()
+
+        bloom = BloomFilter(capacity=max(len(keys) * 2, 1024))
+        # Ключи, добавленные в этом процессе во время запроса, могли в него не попасть
+        for key in (*keys, *self._recent):
+            bloom.add(key)
+        self.bloom = bloom
+        self._recent -= recent
+
+
+token_blacklist_filter = TokenBlacklistFilter()
+
+
+async def is_token_blacklisted(token: str, db: AsyncSession) -> bool:
+    key = token_hash(token)
+    if not token_blacklist_filter.might_contain(key):
+        return False
+    return (await db.execute(
+        select(TokenBlacklist.token_hash).where(TokenBlacklist.token_hash == key)
+    )).first() is not None
+
+
+def blacklist_token(db: AsyncSession, token: str, payload: dict, user_id: Optional[int] = None) -> TokenBlacklist:
+    """
+    Добавляет одноразовый токен в черный список в текущей транзакции. Повторное
+    использование того же токена упадет на commit с IntegrityError.
+    """
+    key = token_hash(token)
+    entry = TokenBlacklist(
+        token_hash=key,
+        user_id=user_id,
+        expires_at=dt.datetime.fromtimestamp(payload["exp"], dt.UTC).replace(tzinfo=None),
+    )
+    db.add(entry)
+    token_blacklist_filter.add(key)
+    return entry
+
+
+async def prune_token_blacklist() -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(TokenBlacklist).where(TokenBlacklist.expires_at <= utcnow()))
+        await db.commit()
+
+
 async def verify_password_reset_token(token: str = None, db: AsyncSession = Depends(get_db)):
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
 
-    if (await db.execute(select(TokenBlacklist).where(TokenBlacklist.token == token))).scalar_one_or_none():
+    if await is_token_blacklisted(token, db):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token already used")
 
     return decode_jwt(token)
@@ -127,12 +293,11 @@ async def verify_telegram_token(token: str):
     if not os.getenv('TELEGRAM_BOT_TOKEN'):
         raise ValueError("TELEGRAM_BOT_TOKEN not set")
     tg_url = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/getMe"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(tg_url)
-        if response.status_code == 200:
-            user_info = response.json()
-            if user_info.get("ok"):
-                return user_info["result"]
+    response = await get_http_client("telegram").get(tg_url)
+    if response.status_code == 200:
+        user_info = response.json()
+        if user_info.get("ok"):
+            return user_info["result"]
     return None
 
 
@@ -165,31 +330,55 @@ async def send_email(
     Raises:
         HTTPException.
     """
-    async with httpx.AsyncClient(verify=False, timeout=10.0) as client:
-        try:
-            response = await client.post(
-                email_api_url,
-                json={
-                    "template_type": template_type,
-                    "recipient_email": recipient_email,
-                    "subject": subject,
-                    "email_data": email_data
-                },
-                headers={"accept": "application/json"}
-            )  # {success: bool, email_id: int}
-            response.raise_for_status()
-            return response.json().get('success', False)
-
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=f"Error communicating with email service: {e.response.text}"
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"An unexpected error occurred: {str(e)}"
-            )
+    try:
+        response = await get_http_client("email").post(
+            email_api_url,
+            json={
+                "template_type": template_type,
+                "recipient_email": recipient_email,
+                "subject": subject,
+                "email_data": email_data
+            },
+            headers={"accept": "application/json"}
+        )  # {success: bool, email_id: int}
+        response.raise_for_status()
+        return response.json().get('success', False)
+
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(
+            status_code=e.response.status_code,
+            detail=f"Error communicating with email service: {e.response.text}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred: {str(e)}"
+        )
+
+
+def enqueue_email(
+        db: AsyncSession,
+        recipient_email: str,
+        template_type: Literal['password_reset', 'email_reset', 'transaction', 'activate_profile'],
+        subject: str,
+        email_data: Dict[str, Any],
+) -> None:
+    """
+    Ставит письмо в очередь outbox в рамках текущей транзакции.
+    Письмо уйдет фоновым воркером после commit сессии, с повторами при ошибках сервиса.
+    """
+    enqueue(db, "send_email", {
+        "recipient_email": recipient_email,
+        "template_type": template_type,
+        "subject": subject,
+        "email_data": email_data,
+    })
+
+
+@job_handler("send_email")
+async def _send_email_job(payload: Dict[str, Any]) -> None:
+    if not await send_email(**payload):
+        raise RuntimeError("Email service did not accept the email")
 
 
 def verify_signature(uuid: str, status: str, signature: str) -> bool:
@@ -203,29 +392,10 @@ def verify_signature(uuid: str, status: str, signature: str) -> bool:
     return hmac.compare_digest(computed_signature, signature)
 
 
-async def refresh_currencies():
-    async with httpx.AsyncClient(verify=False) as client:
-        rub_response = await client.get(f'{url}RUB', follow_redirects=True)
-        rub_response.raise_for_status()
-        rub_response = rub_response.json()['data']
-
-        kzt_response = await client.get(f'{url}KZT', follow_redirects=True)
-        kzt_response.raise_for_status()
-        kzt_response = kzt_response.json()['data']
-
-        rub_value = rub_response['value']
-        kzt_value = kzt_response['value']
-        update_time = kzt_response['update_time']
-
-        global currencies
-        currencies = {
-            "KZT": rub_value / 100,
-            "USD": rub_value / kzt_value,
-            "update_time": update_time
-        }
-
-
 scheduler = AsyncIOScheduler()
-scheduler.add_job(refresh_currencies, 'interval', hours=12)
+scheduler.add_job(prune_done_jobs, 'interval', hours=24)
+scheduler.add_job(prune_token_blacklist, 'interval', hours=1)
+scheduler.add_job(token_blacklist_filter.sync, 'interval', seconds=TOKEN_BLACKLIST_SYNC_SECONDS,
+                  next_run_time=dt.datetime.now())
 scheduler.start()
 atexit.register(scheduler.shutdown)